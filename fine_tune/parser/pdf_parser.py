@@ -1,11 +1,75 @@
 # parser/pdf_parser.py
+import math
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF exposes itself as 'fitz'
 from .base import DocumentParser
 
-class PDFParser:
+def extract_pages(file_bytes: bytes, start: int = 0, stop: int = None):
+    """(page_number, text) for pages [start, stop), numbered from 1; module-level so pool workers can run it."""
+    with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        return [(number + 1, doc[number].get_text()) for number in range(start, stop)]
+
+def after_fork(method):
+    """Call the bound `method` in every forked child while its object is alive (see rag_system's utils.forksafe)."""
+    ref = weakref.WeakMethod(method)
+
+    def hook():
+        bound = ref()
+        if bound is not None:
+            bound()
+
+    os.register_at_fork(after_in_child=hook)
+
+class PDFParser(DocumentParser):
+    """Extracts PDF text from memory; documents over `pages_per_task` pages are split into page
+    ranges that `workers` processes extract concurrently, with pages kept in order."""
+
+    def __init__(self, workers: int = None, pages_per_task: int = 16):
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self._reset()
+        after_fork(self._reset)
+
+    def _reset(self):
+        # a pool inherited over fork has no live processes, the child starts its own
+        self.pool = None
+        self.lock = threading.Lock()
+
     def parse(self, file_bytes: bytes) -> str:
         """Extract text from PDF bytes."""
-        doc = fitz.open(stream=file_bytes, filetype="pdf")
-        text = "\n".join(page.get_text() for page in doc)
-        return text
+        return "\n".join(text for _, text in self.pages(file_bytes))
+
+    def pages(self, source):
+        """Yield (page_number, text) for every page of PDF bytes or a binary stream."""
+        file_bytes = source.read() if hasattr(source, "read") else source
+        with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+            count = doc.page_count
+        if self.workers <= 1 or count <= self.pages_per_task:
+            yield from extract_pages(file_bytes)
+            return
+        # at least pages_per_task pages per task, and no more tasks than workers
+        size = max(self.pages_per_task, math.ceil(count / self.workers))
+        jobs = [self._pool().submit(extract_pages, file_bytes, start, start + size) for start in range(0, count, size)]
+        try:
+            for job in jobs:
+                yield from job.result()
+        finally:
+            for job in jobs:
+                job.cancel()
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
 
+    def _pool(self):
+        with self.lock:
+            if self.pool is None:
+                # spawned, not forked: the trainer and pipelines may have threads running
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.pool
@@ -1,18 +1,19 @@
 # implementations.py
 import boto3
+import io
 import json
 import re
 import uuid
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from botocore.exceptions import ClientError
-import fitz  # PyMuPDF
 from pdfminer.high_level import extract_text
 import asyncio
 from transformers import pipeline, AutoTokenizer, AutoModelForQuestionAnswering
 import logging
 
 from interfaces import *
+from pdf_extractor import PDFExtractor
 
 logger = logging.getLogger(__name__)
 
@@ -60,6 +61,9 @@ class S3BlobStore(IBlobStore):
             raise
 
 class DocumentExtractor(IDocumentExtractor):
+    def __init__(self, pdf_extractor: Optional[PDFExtractor] = None):
+        self.pdf_extractor = pdf_extractor or PDFExtractor()
+
     async def extract_text(self, file_content: bytes, file_extension: str) -> str:
         try:
             if file_extension.lower() == '.pdf':
@@ -74,19 +78,15 @@ class DocumentExtractor(IDocumentExtractor):
             return ""
     
     async def _extract_pdf_text(self, pdf_content: bytes) -> str:
+        loop = asyncio.get_running_loop()
         try:
-            # Use PyMuPDF for better text extraction
-            doc = fitz.open(stream=pdf_content, filetype="pdf")
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-            return text
+            # Use PyMuPDF for better text extraction, off the event loop and split by pages for large files
+            return await loop.run_in_executor(None, self.pdf_extractor.text, pdf_content)
         except Exception as e:
             logger.error(f"Error extracting PDF text with PyMuPDF: {e}")
             # Fallback to pdfminer
             try:
-                return extract_text(pdf_content)
+                return await loop.run_in_executor(None, extract_text, io.BytesIO(pdf_content))
             except Exception as e2:
                 logger.error(f"Error extracting PDF text with pdfminer: {e2}")
                 return ""
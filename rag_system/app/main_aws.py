@@ -1,25 +1,208 @@
+import json
+import weakref
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+from threading import Thread
 from orchestrator.aws_orchestrator import AwsRAGOrchestrator
+from orchestrator.collection_manager import CollectionManager
+from orchestrator.orchestrator import WritesDisabled
+from utils.admission import AdmissionController, Overloaded
+from utils.singleflight import SingleFlight
 
 app = FastAPI()
 
-# Load orchestrator and initialize
+# Load orchestrator; the index is loaded or built at startup
 orchestrator = AwsRAGOrchestrator(
     s3_bucket="your-s3-bucket",
     s3_prefix="your-data-prefix",
     index_path="vector_index/index.bin"
 )
-orchestrator.initialize()
+
+# Named collections each get their own index, loaded on first use and evicted LRU; they share
+# the default orchestrator's models
+collections = CollectionManager(
+    lambda name: AwsRAGOrchestrator(
+        s3_bucket="your-s3-bucket",
+        s3_prefix=f"collections/{name}",
+        index_path="vector_index/index.bin",
+        embedder=orchestrator.embedder,
+        llm=orchestrator.llm,
+        cache_dir=f"~/.cache/rag_system/collections/{name}",
+    ),
+    memory_budget_bytes=2 * 2**30,
+)
+
+# identical concurrent /query requests share one embed + search + generate
+inflight = SingleFlight()
+
+# query work runs on a bounded pool off the event loop; requests beyond the queue cap are rejected.
+# One slot per row of the LLM's batch, so concurrent queries can fill a generation batch
+admission = AdmissionController(max_concurrent=orchestrator.llm.batch_size, max_queue=16)
+
+def overloaded(e: Overloaded):
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+@app.on_event("startup")
+def startup_event():
+    if orchestrator.is_ready():
+        # already initialized by the pre-fork parent (app/prefork.py)
+        return
+
+    # Build or load the index in a background thread so the server remains responsive
+    def background_init():
+        try:
+            orchestrator.initialize()
+        except Exception as e:
+            print(f"🔥 Error during initialization: {e}")
+
+    Thread(target=background_init, daemon=True).start()
+
+class QueryFilters(BaseModel):
+    sources: Optional[List[str]] = None
+    source_prefix: Optional[str] = None
+    date_from: Optional[str] = None  # ISO dates, matched against the filing date in the file name
+    date_to: Optional[str] = None
 
 class QueryRequest(BaseModel):
     query: str
     top_k: int = 3
+    collection: Optional[str] = None
+    filters: Optional[QueryFilters] = None
+
+@app.get("/")
+async def health():
+    # answered on the event loop, so it stays responsive while queries run
+    return {"status": "ok"}
 
 @app.post("/query")
 async def query_rag(req: QueryRequest):
+    if req.collection is None and not orchestrator.is_ready():
+        raise HTTPException(status_code=503, detail="RAG index not available yet.")
+    filters = req.filters.dict(exclude_none=True) if req.filters else None
+    key = (req.collection, req.query, req.top_k, json.dumps(filters, sort_keys=True) if filters else None)
     try:
-        result = orchestrator.query(req.query, req.top_k)
+        if req.collection is not None:
+            result = await inflight.do_async(key, admission.run, collections.query, req.collection, req.query,
+                                             req.top_k, filters)
+        else:
+            result = await inflight.do_async(key, admission.run, orchestrator.query, req.query, req.top_k, filters)
         return {"answer": result}
+    except Overloaded as e:
+        raise overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/query/stream")
+async def query_rag_stream(req: QueryRequest):
+    """Server-sent events: one `context` event after retrieval, then `token` events, then `done`."""
+    if req.collection is None and not orchestrator.is_ready():
+        raise HTTPException(status_code=503, detail="RAG index not available yet.")
+    filters = req.filters.dict(exclude_none=True) if req.filters else None
+    try:
+        if req.collection is not None:
+            (context, tokens), release = await admission.run_held(collections.query_stream, req.collection,
+                                                                  req.query, req.top_k, filters)
+        else:
+            (context, tokens), release = await admission.run_held(orchestrator.query_stream, req.query, req.top_k,
+                                                                  filters)
+    except Overloaded as e:
+        raise overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+    def events():
+        # the admission slot covers generation too, which runs while the tokens are read
+        try:
+            yield f"event: context\ndata: {json.dumps({'context': context})}\n\n"
+            try:
+                for text in tokens:
+                    yield f"event: token\ndata: {json.dumps({'text': text})}\n\n"
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+                return
+            yield "event: done\ndata: {}\n\n"
+        finally:
+            release()
+
+    stream = events()
+    # a stream dropped before it is first read never reaches its finally
+    weakref.finalize(stream, release)
+    return StreamingResponse(stream, media_type="text/event-stream")
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 3
+    collection: Optional[str] = None
+    filters: Optional[QueryFilters] = None
+
+@app.post("/query/batch")
+async def query_rag_batch(req: BatchQueryRequest):
+    if req.collection is None and not orchestrator.is_ready():
+        raise HTTPException(status_code=503, detail="RAG index not available yet.")
+    filters = req.filters.dict(exclude_none=True) if req.filters else None
+    try:
+        if req.collection is not None:
+            results = await admission.run(collections.query_batch, req.collection, req.queries, req.top_k, filters)
+        else:
+            results = await admission.run(orchestrator.query_batch, req.queries, req.top_k, filters)
+        return {"answers": results}
+    except Overloaded as e:
+        raise overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+class DocumentRequest(BaseModel):
+    source: str
+    text: Optional[str] = None
+
+@app.put("/documents")
+def upsert_document(req: DocumentRequest):
+    if not orchestrator.is_ready():
+        raise HTTPException(status_code=503, detail="RAG index not available yet.")
+    try:
+        return orchestrator.upsert_document(req.source, req.text)
+    except WritesDisabled as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/documents/{source:path}")
+def delete_document(source: str):
+    if not orchestrator.is_ready():
+        raise HTTPException(status_code=503, detail="RAG index not available yet.")
+    try:
+        return orchestrator.delete_document(source)
+    except WritesDisabled as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Document not indexed: {source}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/index/rebuild", status_code=202)
+def rebuild_index():
+    try:
+        return {"building_version": orchestrator.rebuild()}
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/status")
+def get_status():
+    return {"ready": orchestrator.is_ready(), "index_version": orchestrator.version, "admission": admission.stats(),
+            "dedup": orchestrator.dedup_stats()}
+
+@app.get("/collections")
+def get_collections():
+    return collections.status()
@@ -0,0 +1,88 @@
+"""Pre-fork serving: load the models and index once, then fork uvicorn workers that share them.
+
+    python -m app.prefork app.main_local:app --workers 4 --port 8000
+
+The parent imports the app module and initializes its orchestrator before forking, so FlanT5,
+MiniLM and the FAISS index are in memory once and the workers share those pages copy-on-write.
+Threads, pools and SQLite connections are recreated in each worker (see utils.forksafe).
+
+Each worker holds its own view of the index after fork, so updates in one worker would clash with
+the others: PUT/DELETE /documents and /index/rebuild answer 409 in this mode. Run a single process
+when the index takes writes.
+"""
+import argparse
+import gc
+import importlib
+import os
+import signal
+import socket
+import faiss
+import torch
+import uvicorn
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("app", help="module:attribute of the FastAPI app, e.g. app.main_local:app")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads-per-worker", type=int, default=1,
+                        help="torch/FAISS threads in each worker; workers already spread over the cores")
+    args = parser.parse_args()
+
+    module_name, _, attr = args.app.partition(":")
+    module = importlib.import_module(module_name)
+    app = getattr(module, attr or "app")
+    # the app's startup hook finds the orchestrator ready in the workers and skips loading
+    module.orchestrator.initialize()
+    module.orchestrator.accept_writes = False
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+
+    # keep the garbage collector from touching (and so copying) every object inherited from the parent
+    gc.collect()
+    gc.freeze()
+
+    workers = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # OpenMP thread pools don't survive fork; single-threaded regions never touch them
+            torch.set_num_threads(args.threads_per_worker)
+            faiss.omp_set_num_threads(args.threads_per_worker)
+            uvicorn.Server(uvicorn.Config(app, lifespan="on")).run(sockets=[sock])
+            os._exit(0)
+        workers.add(pid)
+        print(f"👷 Started worker {pid}")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(args.workers):
+        spawn()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            print(f"⚠️ Worker {pid} exited with status {status}, restarting")
+            spawn()
+    module.orchestrator.close()
+
+if __name__ == "__main__":
+    main()
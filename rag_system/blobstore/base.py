@@ -1,3 +1,5 @@
+import os
+import tempfile
 from abc import ABC, abstractmethod
 
 class BlobStore(ABC):
@@ -9,6 +11,18 @@ class BlobStore(ABC):
     def read_file(self, path: str) -> str:
         pass
 
+    def read_bytes(self, path: str) -> bytes:
+        """Read a file's raw content, e.g. to parse a PDF without a temp file"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            local_path = os.path.join(tmpdir, os.path.basename(path))
+            self.download_file(path, local_path)
+            with open(local_path, "rb") as f:
+                return f.read()
+
+    def read_many(self, paths: list[str]) -> list[bytes]:
+        """Read several files' raw content, in the order given"""
+        return [self.read_bytes(path) for path in paths]
+
     @abstractmethod
     def upload_file(self, local_path: str, remote_path: str):
         """Upload a local file to the blobstore path"""
@@ -19,7 +33,27 @@ class BlobStore(ABC):
         """Download a blobstore file to a local file path"""
         pass
 
+    def download_many(self, files: dict[str, str]):
+        """Download each blobstore path in `files` to the local path it maps to"""
+        for remote_path, local_path in files.items():
+            self.download_file(remote_path, local_path)
+
+    @abstractmethod
+    def delete_file(self, remote_path: str):
+        """Delete a file from the blobstore"""
+        pass
+
     @abstractmethod
     def exists(self, remote_path: str) -> bool:
         """Check if a file exists in the blobstore"""
         pass
+
+    @abstractmethod
+    def checksum(self, path: str) -> str:
+        """Return a content hash (or ETag) that changes whenever the file changes"""
+        pass
+
+    def list_checksums(self, include=None) -> dict[str, str]:
+        """Map every file in the blobstore (or those `include(path)` accepts) to its checksum"""
+        # filtered before hashing, so index files and model weights kept alongside are never read
+        return {path: self.checksum(path) for path in self.list_files() if include is None or include(path)}
@@ -1,3 +1,4 @@
+import hashlib
 import os
 from .base import BlobStore
 
@@ -6,7 +7,11 @@ class LocalBlobStore(BlobStore):
         self.base_path = os.path.abspath(base_path)
 
     def _full_path(self, path: str) -> str:
-        return os.path.join(self.base_path, path)
+        full_path = os.path.abspath(os.path.join(self.base_path, path))
+        # absolute paths and ".." would otherwise reach files outside the store
+        if os.path.commonpath([full_path, self.base_path]) != self.base_path:
+            raise ValueError(f"Path is outside the blobstore: {path}")
+        return full_path
 
     def list_files(self):
         file_list = []
@@ -22,6 +27,10 @@ class LocalBlobStore(BlobStore):
         with open(full_path, "r", encoding="utf-8") as f:
             return f.read()
 
+    def read_bytes(self, path: str) -> bytes:
+        with open(self._full_path(path), "rb") as f:
+            return f.read()
+
     def upload_file(self, local_path: str, remote_path: str):
         dest = self._full_path(remote_path)
         os.makedirs(os.path.dirname(dest), exist_ok=True)
@@ -34,5 +43,15 @@ class LocalBlobStore(BlobStore):
         with open(src, "rb") as f_src, open(local_path, "wb") as f_dst:
             f_dst.write(f_src.read())
 
+    def delete_file(self, remote_path: str):
+        os.remove(self._full_path(remote_path))
+
     def exists(self, remote_path: str) -> bool:
         return os.path.exists(self._full_path(remote_path))
+
+    def checksum(self, path: str) -> str:
+        digest = hashlib.sha256()
+        with open(self._full_path(path), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
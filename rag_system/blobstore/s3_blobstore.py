@@ -1,32 +1,103 @@
 import boto3
+from concurrent.futures import ThreadPoolExecutor
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from .base import BlobStore
 
 class S3BlobStore(BlobStore):
-    def __init__(self, bucket: str, prefix: str = ""):
+    """Blobstore on an S3 bucket, or any S3-compatible endpoint (MinIO, moto server) via `endpoint_url`.
+
+    Bulk reads and downloads run up to `max_workers` requests at once, and objects larger than
+    `part_size` are fetched as `part_workers` concurrent ranged GETs. The connection pool is sized so
+    that none of these requests waits for a connection.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, max_workers: int = 16,
+                 part_size: int = 8 * 2**20, part_workers: int = 4):
         self.bucket = bucket
         self.prefix = prefix.rstrip("/")
-        self.s3 = boto3.client("s3")
+        self.max_workers = max_workers
+        self.part_size = part_size
+        self.part_workers = part_workers
+        config = Config(
+            max_pool_connections=max_workers * part_workers,
+            retries={"max_attempts": 5, "mode": "standard"},
+            tcp_keepalive=True,
+        )
+        self.s3 = boto3.client("s3", endpoint_url=endpoint_url, config=config)
+        # upload_file/download_file go through boto3's transfer manager, split the same way
+        self.transfer_config = TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size,
+                                              max_concurrency=part_workers)
 
     def _full_key(self, path: str) -> str:
         return f"{self.prefix}/{path}".lstrip("/")
 
+    def list_objects(self) -> dict[str, dict]:
+        """Map every file to its {"size", "etag"}, following the listing past S3's 1000-key pages"""
+        prefix = f"{self.prefix}/" if self.prefix else ""
+        objects = {}
+        for page in self.s3.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith("/"):
+                    continue  # folder placeholder created by the console
+                # paths are relative to the prefix, like every other method takes them
+                objects[obj["Key"][len(prefix):]] = {"size": obj["Size"], "etag": obj["ETag"].strip('"')}
+        return objects
+
     def list_files(self):
-        response = self.s3.list_objects_v2(Bucket=self.bucket, Prefix=self.prefix)
-        return [obj['Key'] for obj in response.get('Contents', [])]
+        return list(self.list_objects())
+
+    def list_checksums(self, include=None):
+        # ETags come back with the listing, so no per-object HEAD is needed
+        return {path: obj["etag"] for path, obj in self.list_objects().items() if include is None or include(path)}
 
     def read_file(self, path: str) -> str:
+        return self.read_bytes(path).decode("utf-8")
+
+    def read_bytes(self, path: str) -> bytes:
         key = self._full_key(path)
-        obj = self.s3.get_object(Bucket=self.bucket, Key=key)
-        return obj['Body'].read().decode("utf-8")
+        try:
+            # the first part also tells the object's size; any further parts are fetched concurrently
+            first = self.s3.get_object(Bucket=self.bucket, Key=key, Range=f"bytes=0-{self.part_size - 1}")
+        except ClientError as e:
+            if e.response['Error']['Code'] == "InvalidRange":
+                return b""  # empty object, no byte range to satisfy
+            raise
+        size = int(first["ContentRange"].rsplit("/", 1)[1])
+        data = first["Body"].read()
+        if size <= self.part_size:
+            return data
+
+        def read_range(start):
+            end = min(start + self.part_size, size) - 1
+            # IfMatch fails the read instead of mixing parts of two versions if the object is replaced
+            return self.s3.get_object(Bucket=self.bucket, Key=key, Range=f"bytes={start}-{end}",
+                                      IfMatch=first["ETag"])["Body"].read()
+
+        with ThreadPoolExecutor(self.part_workers) as pool:
+            return b"".join([data, *pool.map(read_range, range(self.part_size, size, self.part_size))])
+
+    def read_many(self, paths: list[str]) -> list[bytes]:
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            return list(pool.map(self.read_bytes, paths))
 
     def upload_file(self, local_path: str, remote_path: str):
         key = self._full_key(remote_path)
-        self.s3.upload_file(local_path, self.bucket, key)
+        self.s3.upload_file(local_path, self.bucket, key, Config=self.transfer_config)
 
     def download_file(self, remote_path: str, local_path: str):
         key = self._full_key(remote_path)
-        self.s3.download_file(self.bucket, key, local_path)
+        self.s3.download_file(self.bucket, key, local_path, Config=self.transfer_config)
+
+    def download_many(self, files: dict[str, str]):
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            # list() re-raises the first failed download
+            list(pool.map(self.download_file, files.keys(), files.values()))
+
+    def delete_file(self, remote_path: str):
+        key = self._full_key(remote_path)
+        self.s3.delete_object(Bucket=self.bucket, Key=key)
 
     def exists(self, remote_path: str) -> bool:
         key = self._full_key(remote_path)
@@ -37,3 +108,7 @@ class S3BlobStore(BlobStore):
             if e.response['Error']['Code'] == "404":
                 return False
             raise
+
+    def checksum(self, path: str) -> str:
+        key = self._full_key(path)
+        return self.s3.head_object(Bucket=self.bucket, Key=key)['ETag'].strip('"')
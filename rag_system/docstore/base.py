@@ -0,0 +1,25 @@
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+class DocStore(ABC):
+    @abstractmethod
+    def put_many(self, ids: List[int], documents: List[dict]): pass
+
+    @abstractmethod
+    def get_many(self, ids: List[int]) -> List[Optional[dict]]: pass
+
+    @abstractmethod
+    def ids_matching(self, sources: Optional[List[str]] = None, source_prefix: Optional[str] = None,
+                     date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[int]: pass
+
+    @abstractmethod
+    def delete_many(self, ids: List[int]): pass
+
+    @abstractmethod
+    def count(self) -> int: pass
+
+    @abstractmethod
+    def commit(self): pass
+
+    @abstractmethod
+    def close(self): pass
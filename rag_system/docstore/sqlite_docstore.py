@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import threading
+from utils.forksafe import after_fork
+from .base import DocStore
+
+class SQLiteDocStore(DocStore):
+    """Chunk store keyed by FAISS id; texts stay on disk and are read k at a time."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # shared across request threads, writes are serialized by the lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "id INTEGER PRIMARY KEY, text TEXT NOT NULL, source TEXT, meta TEXT, date TEXT)"
+        )
+        # stores written before date filtering existed lack the column
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(docs)")]
+        if "date" not in columns:
+            self.conn.execute("ALTER TABLE docs ADD COLUMN date TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS docs_source ON docs(source)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS docs_date ON docs(date)")
+        self.conn.commit()
+        self.closed = False
+        after_fork(self._reconnect)
+
+    def put_many(self, ids, documents):
+        rows = []
+        for i, doc in zip(ids, documents):
+            extra = {k: v for k, v in doc.items() if k not in ("text", "source", "date")}
+            rows.append((int(i), doc["text"], doc.get("source"), json.dumps(extra) if extra else None,
+                         doc.get("date")))
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO docs (id, text, source, meta, date) VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    def get_many(self, ids):
+        ids = [int(i) for i in ids]
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT id, text, source, meta, date FROM docs WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        found = {}
+        for i, text, source, meta, date in rows:
+            doc = {"text": text, "source": source}
+            if date:
+                doc["date"] = date
+            if meta:
+                doc.update(json.loads(meta))
+            found[i] = doc
+        # keep the caller's (rank) order
+        return [found.get(i) for i in ids]
+
+    def ids_matching(self, sources=None, source_prefix=None, date_from=None, date_to=None):
+        # served from the source/date indexes; only ids come back, no chunk text
+        clauses, args = [], []
+        if sources:
+            clauses.append(f"source IN ({','.join('?' * len(sources))})")
+            args.extend(sources)
+        if source_prefix:
+            clauses.append("substr(source, 1, ?) = ?")
+            args.extend([len(source_prefix), source_prefix])
+        if date_from:
+            clauses.append("date >= ?")
+            args.append(date_from)
+        if date_to:
+            clauses.append("date <= ?")
+            args.append(date_to)
+        where = " AND ".join(clauses) or "1"
+        with self.lock:
+            return [row[0] for row in self.conn.execute(f"SELECT id FROM docs WHERE {where}", args)]
+
+    def delete_many(self, ids):
+        with self.lock:
+            self.conn.executemany("DELETE FROM docs WHERE id = ?", [(int(i),) for i in ids])
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+            self.closed = True
+
+    def _reconnect(self):
+        # SQLite connections must not be used across fork; keep the inherited one referenced so it is
+        # never closed from the child, which would drop the parent's file locks
+        self.lock = threading.Lock()
+        if not self.closed:
+            self._inherited_conn = self.conn
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
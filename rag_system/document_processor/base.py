@@ -1,6 +1,17 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Iterator, List
 
 class DocumentProcessor(ABC):
     @abstractmethod
     def process(self) -> List[str]: pass
+
+    @abstractmethod
+    def supports(self, file_path: str) -> bool: pass
+
+    @abstractmethod
+    def process_file(self, file_path: str) -> List[dict]: pass
+
+    def process_files(self, file_paths: List[str]) -> Iterator[List[dict]]:
+        """Chunks for each file, yielded in the order given."""
+        for path in file_paths:
+            yield self.process_file(path)
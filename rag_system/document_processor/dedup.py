@@ -0,0 +1,131 @@
+import hashlib
+import re
+import unicodedata
+import zlib
+import numpy as np
+
+# 2**31 - 1: a * x + b stays inside uint64 for 32-bit shingle hashes
+PRIME = (1 << 31) - 1
+NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+class ChunkDeduplicator:
+    """Drops chunks that repeat one seen before: filing headers, footers, disclaimers.
+
+    Exact repeats are caught by a hash of the normalized text. Near repeats are only dropped when
+    `threshold` is set: each chunk then gets a MinHash signature of `num_perm` hashes over its word
+    `shingle`-grams, and an LSH index of `bands` bands finds earlier chunks that share a band; a
+    candidate whose estimated Jaccard similarity reaches `threshold` and that has exactly the same
+    numbers makes the chunk a duplicate, so two periods' tables that differ only in their figures are
+    both kept. The first occurrence is always the one kept.
+
+    Kept chunks are recorded under an owner (the file they came from), and `repeats` maps each owner
+    to the owners of the chunks its dropped ones repeat; forget(owner) takes an owner's chunks back
+    out, so whoever repeated them must be filtered again.
+
+    With bands=16 of 8 rows, pairs at 0.8 similarity become candidates ~95% of the time and pairs at
+    0.9 almost always. Near-duplicate state grows with the number of distinct chunks, ~2-3 KiB each.
+    """
+
+    def __init__(self, threshold: float = None, num_perm: int = 128, bands: int = 16, shingle: int = 3,
+                 seed: int = 1234):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle = shingle
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, PRIME, num_perm, dtype=np.uint64)
+        self.exact = {}  # digest -> owner of the chunk kept for it
+        self.buckets = {}  # hash of (band, band values) -> indexes into signatures
+        self.signatures = []  # None once the owner is forgotten
+        self.numbers = []  # numeric tokens of each signature's chunk
+        self.owners = []  # owner of each signature's chunk
+        self.kept = {}  # owner -> (digests, signature indexes) of its kept chunks
+        self.repeats = {}  # owner -> owners of the chunks its dropped ones repeat
+        self.stats = {"chunks": 0, "exact_duplicates": 0, "near_duplicates": 0, "chars": 0, "duplicate_chars": 0}
+
+    def filter(self, chunks, owner=None):
+        """The chunks that don't duplicate one seen before, in order; kept ones are recorded under `owner`."""
+        return [chunk for chunk in chunks if not self.is_duplicate(chunk["text"], owner)]
+
+    def is_duplicate(self, text, owner=None):
+        self.stats["chunks"] += 1
+        self.stats["chars"] += len(text)
+        key = self._key(text)
+        match = self._match(key)
+        if match is None:
+            self._record(key, owner)
+            return False
+        kind, original = match
+        self.stats[kind] += 1
+        self.stats["duplicate_chars"] += len(text)
+        if original != owner:
+            self.repeats.setdefault(owner, set()).add(original)
+        return True
+
+    def add(self, text, owner=None):
+        """Record `text` as a kept chunk of `owner` without counting it, e.g. when reloading an index."""
+        key = self._key(text)
+        if key[0] not in self.exact:
+            self._record(key, owner)
+
+    def forget(self, owner):
+        """Drop the chunks kept for `owner` and what its dropped chunks repeated."""
+        digests, indexes = self.kept.pop(owner, ((), ()))
+        for digest in digests:
+            del self.exact[digest]
+        for i in indexes:
+            # its bucket entries stay behind and are skipped
+            self.signatures[i] = None
+        self.repeats.pop(owner, None)
+
+    def _key(self, text):
+        normalized = " ".join(unicodedata.normalize("NFKC", text).lower().split())
+        digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+        if self.threshold is None:
+            return digest, None, None, None
+        signature = self._signature(normalized)
+        bands = [hash((band, signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+                 for band in range(self.bands)]
+        return digest, signature, NUMBER.findall(normalized), bands
+
+    def _match(self, key):
+        # ("exact_duplicates" or "near_duplicates", owner of the earlier chunk), or None
+        digest, signature, numbers, bands = key
+        if digest in self.exact:
+            return "exact_duplicates", self.exact[digest]
+        if signature is None:
+            return None
+        for band in bands:
+            for candidate in self.buckets.get(band, ()):
+                # the share of equal MinHash values estimates the Jaccard similarity of the shingle sets;
+                # a changed figure barely moves it, but makes the chunk carry different facts
+                if (self.signatures[candidate] is not None
+                        and np.mean(self.signatures[candidate] == signature) >= self.threshold
+                        and self.numbers[candidate] == numbers):
+                    return "near_duplicates", self.owners[candidate]
+        return None
+
+    def _record(self, key, owner):
+        digest, signature, numbers, bands = key
+        digests, indexes = self.kept.setdefault(owner, ([], []))
+        self.exact[digest] = owner
+        digests.append(digest)
+        if signature is None:
+            return
+        self.signatures.append(signature)
+        self.numbers.append(numbers)
+        self.owners.append(owner)
+        indexes.append(len(self.signatures) - 1)
+        for band in bands:
+            self.buckets.setdefault(band, []).append(len(self.signatures) - 1)
+
+    def _signature(self, normalized):
+        words = normalized.split()
+        n = self.shingle
+        shingles = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # one universal hash per permutation, minimum over the shingles
+        return ((np.outer(self.a, x) + self.b[:, None]) % PRIME).min(axis=1).astype(np.uint32)
@@ -0,0 +1,79 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import fitz  # PyMuPDF
+from utils.forksafe import after_fork
+
+def page_count(data):
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        return doc.page_count
+
+def extract_pages(data, start=0, stop=None):
+    """(page_number, text) for pages [start, stop) of a PDF held in memory, numbered from 1.
+
+    Module-level so process pool workers can run it.
+    """
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        return [(number + 1, doc[number].get_text()) for number in range(start, stop)]
+
+class PDFExtractor:
+    """Extracts text page by page from PDFs given as bytes or a binary stream, without temp files.
+
+    Documents longer than `pages_per_task` pages are split into contiguous page ranges that `workers`
+    spawned processes extract concurrently; pages still come back in order. The pool starts on first use.
+    """
+
+    def __init__(self, workers=None, pages_per_task=16):
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self._reset()
+        after_fork(self._reset)
+
+    def _reset(self):
+        # a pool inherited over fork has no live processes, the child starts its own
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def splits(self, data):
+        """Whether `data` is long enough to be worth spreading over several processes."""
+        return self.workers > 1 and page_count(data) > self.pages_per_task
+
+    def submit(self, data, executor=None):
+        """Start extracting `data` on `executor` (the extractor's own pool by default), one future per page range."""
+        count = page_count(data)
+        # at least pages_per_task pages per task, and no more tasks than workers
+        size = max(self.pages_per_task, math.ceil(count / self.workers))
+        executor = executor or self._pool()
+        return [executor.submit(extract_pages, data, start, start + size) for start in range(0, count, size)]
+
+    def pages(self, source):
+        """Yield (page_number, text) for every page, numbered from 1."""
+        data = source.read() if hasattr(source, "read") else source
+        if not self.splits(data):
+            yield from extract_pages(data)
+            return
+        jobs = self.submit(data)
+        try:
+            for job in jobs:
+                yield from job.result()
+        finally:
+            for job in jobs:
+                job.cancel()
+
+    def text(self, source):
+        return "".join(text for _, text in self.pages(source))
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    def _pool(self):
+        with self.lock:
+            if self.pool is None:
+                # spawned, not forked: the serving process has model and scheduler threads running
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self.pool
@@ -1,45 +1,108 @@
+import multiprocessing
+import re
 import textwrap
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from datetime import datetime
 from blobstore.base import BlobStore
 from .base import DocumentProcessor
-import fitz  # PyMuPDF
+from .pdf_extractor import PDFExtractor, extract_pages
 import os
 
+# EDGAR-style filing names carry the period date, e.g. tsla-20250331.pdf
+FILING_DATE = re.compile(r"(?<!\d)(\d{4})(\d{2})(\d{2})(?!\d)")
+
 class SimpleDocumentProcessor(DocumentProcessor):
-    def __init__(self, blobstore: BlobStore, chunk_size=500):
+    SUPPORTED_EXTENSIONS = (".txt", ".pdf")
+
+    def __init__(self, blobstore: BlobStore, chunk_size=500, workers=None, io_workers=8):
         self.blobstore = blobstore
         self.chunk_size = chunk_size
+        # processes for PDF extraction and chunking (1 = in-process), threads for blob downloads
+        self.workers = workers or os.cpu_count() or 1
+        self.io_workers = io_workers
+        self.extractor = PDFExtractor(workers=self.workers)
 
     def process(self):
-        chunks = []
-
+        file_paths = []
         for file_path in self.blobstore.list_files():
-            ext = os.path.splitext(file_path)[1].lower()
-
-            if ext == ".txt":
-                text = self.blobstore.read_file(file_path)
-            elif ext == ".pdf":
-                text = self._extract_text_from_pdf(file_path)
-            else:
+            if not self.supports(file_path):
                 print(f"⚠️ Skipping unsupported file type: {file_path}")
                 continue
+            file_paths.append(file_path)
+
+        return [chunk for chunks in self.process_files(file_paths) for chunk in chunks]
 
-            wrapped = textwrap.wrap(text, self.chunk_size)
-            for chunk in wrapped:
-                chunks.append({"text": chunk, "source": file_path})
+    def supports(self, file_path):
+        return os.path.splitext(file_path)[1].lower() in self.SUPPORTED_EXTENSIONS
 
-        return chunks
+    def process_file(self, file_path):
+        # on its own, a long PDF is split by pages across the extractor's processes
+        return chunk_document(file_path, self.blobstore.read_bytes(file_path), self.chunk_size, self.extractor)
 
-    def _extract_text_from_pdf(self, file_path):
-        # Download from blobstore to local temp path
-        local_pdf_path = f"/tmp/{os.path.basename(file_path)}"
-        self.blobstore.download_file(file_path, local_pdf_path)
+    def process_files(self, file_paths):
+        """Yield each file's chunks in the order of `file_paths`, downloading on a thread pool and
+        extracting on a process pool; only a small window of files is in flight at a time."""
+        if self.workers <= 1 or len(file_paths) <= 1:
+            for path in file_paths:
+                yield self.process_file(path)
+            return
 
-        text = ""
+        # spawned, not forked: the serving process has model and scheduler threads running
+        io = ThreadPoolExecutor(self.io_workers, thread_name_prefix="ingest-io")
+        cpu = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+        def submit(path):
+            # runs on an io thread; returns a callable that waits for the file's chunks
+            data = self.blobstore.read_bytes(path)
+            if path.lower().endswith(".pdf") and self.extractor.splits(data):
+                # a long filing is spread over the pool by page ranges instead of holding up one process
+                jobs = self.extractor.submit(data, cpu)
+                return lambda: chunk_text(path, "".join(text for job in jobs for _, text in job.result()),
+                                          self.chunk_size)
+            return cpu.submit(chunk_document, path, data, self.chunk_size).result
+
+        paths = iter(file_paths)
+        # bounds how many downloaded or extracted files wait in memory for the consumer
+        pending = deque(io.submit(submit, path) for path in islice(paths, 2 * self.workers))
         try:
-            with fitz.open(local_pdf_path) as doc:
-                for page in doc:
-                    text += page.get_text()
+            while pending:
+                chunks = pending.popleft().result()()
+                for path in islice(paths, 1):
+                    pending.append(io.submit(submit, path))
+                yield chunks
         finally:
-            os.remove(local_pdf_path)
+            io.shutdown(cancel_futures=True)
+            cpu.shutdown(cancel_futures=True)
+
+def chunk_document(file_path, data, chunk_size, extractor=None):
+    """Extract and chunk one file's content; module-level so process pool workers can run it.
+
+    Without an `extractor` (as inside a pool worker) PDF pages are read serially.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".txt":
+        text = data.decode("utf-8")
+    elif extractor:
+        text = extractor.text(data)
+    else:
+        text = "".join(page_text for _, page_text in extract_pages(data))
+    return chunk_text(file_path, text, chunk_size)
+
+def chunk_text(file_path, text, chunk_size):
+    wrapped = textwrap.wrap(text, chunk_size)
+    metadata = {"source": file_path}
+    date = _filing_date(file_path)
+    if date:
+        metadata["date"] = date
+    return [{"text": chunk, **metadata} for chunk in wrapped]
 
-        return text
+def _filing_date(file_path):
+    match = FILING_DATE.search(os.path.basename(file_path))
+    if not match:
+        return None
+    try:
+        return datetime(*map(int, match.groups())).date().isoformat()
+    except ValueError:
+        return None
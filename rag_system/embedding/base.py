@@ -4,3 +4,11 @@ from typing import List
 class EmbeddingModel(ABC):
     @abstractmethod
     def embed(self, texts: List[str]) -> List[List[float]]: pass
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # user queries; models that encode queries differently from passages override this
+        return self.embed(texts)
+
+    def save(self):
+        # persist any cached state; stateless models have nothing to do
+        pass
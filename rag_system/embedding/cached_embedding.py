@@ -0,0 +1,131 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from utils.forksafe import after_fork
+from .base import EmbeddingModel
+
+class CachedEmbedding(EmbeddingModel):
+    """Wraps an EmbeddingModel so each distinct text is only encoded once.
+
+    Chunk vectors (`embed`) go to a SQLite store at `path`, optionally mirrored to `remote_path` in a
+    blobstore so a fresh container starts warm. Query vectors (`embed_queries`) are kept in an
+    in-memory LRU of `query_cache_size` entries. Entries are keyed by (model name, normalized-text hash),
+    and only cache misses reach the wrapped model, in one batch.
+    """
+
+    def __init__(self, model: EmbeddingModel, path: str, blobstore=None, remote_path: str = None,
+                 query_cache_size: int = 1024):
+        self.model = model
+        self.model_name = getattr(model, "model_name", type(model).__name__)
+        self.path = os.path.expanduser(path)
+        self.blobstore = blobstore
+        self.remote_path = remote_path
+        self.query_cache_size = query_cache_size
+        self.queries = OrderedDict()  # key -> vector, least recently used first
+        self.lock = threading.Lock()
+        self.dirty = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if not os.path.exists(self.path) and self.remote_path and self.blobstore.exists(self.remote_path):
+            self.blobstore.download_file(self.remote_path, self.path)
+        # shared across request threads, access is serialized by the lock
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, key))"
+        )
+        self.conn.commit()
+        after_fork(self._reconnect)
+
+    def embed(self, texts):
+        keys = [self._key(t) for t in texts]
+        with self.lock:
+            found = self._lookup(set(keys))
+        misses = self._misses(texts, keys, found)
+        if misses:
+            vectors = self._encode(list(misses.values()))
+            rows = [(self.model_name, key, vector.tobytes()) for key, vector in zip(misses, vectors)]
+            with self.lock:
+                self.conn.executemany("INSERT OR REPLACE INTO embeddings (model, key, vector) VALUES (?, ?, ?)", rows)
+                self.conn.commit()
+                self.dirty = True
+            found.update(zip(misses, vectors))
+        return np.array([found[key] for key in keys], dtype='float32')
+
+    def embed_queries(self, texts):
+        keys = [self._key(t) for t in texts]
+        with self.lock:
+            found = {}
+            for key in keys:
+                if key in self.queries:
+                    self.queries.move_to_end(key)
+                    found[key] = self.queries[key]
+        misses = self._misses(texts, keys, found)
+        if misses:
+            vectors = self._encode(list(misses.values()), queries=True)
+            with self.lock:
+                for key, vector in zip(misses, vectors):
+                    self.queries[key] = vector
+                    found[key] = vector
+                while len(self.queries) > self.query_cache_size:
+                    self.queries.popitem(last=False)
+        return np.array([found[key] for key in keys], dtype='float32')
+
+    def save(self):
+        """Upload the chunk store to the blobstore if new vectors were added since the last save."""
+        if not (self.dirty and self.remote_path):
+            return
+        with self.lock:
+            self.conn.commit()
+            self.dirty = False
+            # a consistent copy, taken while no writer holds the store
+            snapshot_fp = self.path + ".upload"
+            snapshot = sqlite3.connect(snapshot_fp)
+            self.conn.backup(snapshot)
+            snapshot.close()
+        try:
+            self.blobstore.upload_file(snapshot_fp, self.remote_path)
+        finally:
+            os.remove(snapshot_fp)
+
+    def _reconnect(self):
+        # same as SQLiteDocStore: a fresh connection per forked worker, the inherited one is left open
+        self.lock = threading.Lock()
+        self._inherited_conn = self.conn
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+
+    def _encode(self, texts, queries=False):
+        vectors = self.model.embed_queries(texts) if queries else self.model.embed(texts)
+        return np.asarray(vectors, dtype='float32')
+
+    def _lookup(self, keys):
+        found = {}
+        keys = list(keys)
+        # stay under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(batch))})",
+                [self.model_name] + batch,
+            ).fetchall()
+            found.update((key, np.frombuffer(vector, dtype='float32')) for key, vector in rows)
+        return found
+
+    @staticmethod
+    def _misses(texts, keys, found):
+        # key -> text for each distinct text that is not cached, in first-seen order
+        misses = {}
+        for text, key in zip(texts, keys):
+            if key not in found and key not in misses:
+                misses[key] = text
+        return misses
+
+    @staticmethod
+    def _key(text):
+        # whitespace and Unicode form differences don't change what the model sees
+        normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
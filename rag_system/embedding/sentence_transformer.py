@@ -3,6 +3,7 @@ from .base import EmbeddingModel
 
 class SentenceTransformerEmbedding(EmbeddingModel):
     def __init__(self, model_name='sentence-transformers/all-MiniLM-L6-v2'):
+        self.model_name = model_name
         self.model = SentenceTransformer(model_name)
 
     def embed(self, texts):
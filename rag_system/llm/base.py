@@ -1,5 +1,24 @@
 from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional
 
 class LLMModel(ABC):
+    # prompts one generation pass can take together; callers size their concurrency to it
+    batch_size = 1
+
     @abstractmethod
     def generate(self, context: str, query: str) -> str: pass
+
+    def generate_batch(self, contexts: List[str], queries: List[str]) -> List[str]:
+        return [self.generate(context, query) for context, query in zip(contexts, queries)]
+
+    def generate_stream(self, context: str, query: str) -> Iterator[str]:
+        # models without incremental decoding stream the whole answer as one piece
+        yield self.generate(context, query)
+
+    def count_tokens(self, text: str) -> int:
+        # rough stand-in for models without a tokenizer
+        return len(text.split())
+
+    def context_budget(self, query: str) -> Optional[int]:
+        """Tokens left for retrieved context once the prompt template and query are in; None if unbounded."""
+        return None
@@ -1,13 +1,19 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, TextIteratorStreamer
 import torch
 from .base import LLMModel
+from .scheduler import GenerationScheduler
 
 class FlanT5(LLMModel):
-    def __init__(self, model_name="google/flan-t5-large"):
+    def __init__(self, model_name="google/flan-t5-large", batch_size=8, max_wait=0.01):
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model.to(self.device)
+        self.model.eval()
+        self.batch_size = batch_size
+        # concurrent requests share decoding steps instead of each running model.generate
+        self.scheduler = GenerationScheduler(self.model, self.tokenizer, self.device, max_batch_size=batch_size,
+                                             max_wait=max_wait, max_new_tokens=250, max_input_length=512)
 
     def gen_prompt_few_shot(self, context, query):
         FEW_SHOT_EXAMPLES = """
@@ -36,8 +42,24 @@ Answer:
         prompt = f"Context:\n{context}\n\nQuestion: {query}\nAnswer:"
         return prompt
 
+    def count_tokens(self, text):
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def context_budget(self, query):
+        # the 512-token encoder window minus the few-shot template, the query and </s>
+        return 512 - self.count_tokens(self.gen_prompt_few_shot("", query)) - 1
+
     def generate(self, context, query):
         prompt = self.gen_prompt_few_shot(context, query)
-        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512).to(self.device)
-        outputs = self.model.generate(**inputs, max_new_tokens=250)
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+        return self.scheduler.submit(prompt).result()
+
+    def generate_batch(self, contexts, queries):
+        futures = [self.scheduler.submit(self.gen_prompt_few_shot(c, q)) for c, q in zip(contexts, queries)]
+        return [future.result() for future in futures]
+
+    def generate_stream(self, context, query):
+        streamer = TextIteratorStreamer(self.tokenizer, skip_special_tokens=True)
+        future = self.scheduler.submit(self.gen_prompt_few_shot(context, query), streamer)
+        yield from streamer
+        # re-raise a decoding error that ended the stream early
+        future.result()
@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future
+from threading import Thread
+import onnxruntime as ort
+from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from transformers import AutoTokenizer, TextIteratorStreamer
+from blobstore.base import BlobStore
+from .flan_t5 import FlanT5
+
+ONNX_FILES = ("encoder_model.onnx", "decoder_model.onnx", "decoder_with_past_model.onnx")
+
+class FlanT5Onnx(FlanT5):
+    """FlanT5 exported to ONNX, with int8 dynamic quantization, running on ONNX Runtime for CPU serving.
+
+    Exporting and quantizing take minutes, so they run once. The files are then cached in the
+    blobstore under `artifact_prefix`, and later starts and other replicas download them instead.
+    Prompts and the generate(context, query) contract are the same as FlanT5.
+    """
+
+    def __init__(self, blobstore: BlobStore, model_name="google/flan-t5-large",
+                 artifact_prefix=None, cache_dir="~/.cache/rag_system", quantize=True, batch_size=8):
+        self.blobstore = blobstore
+        # e.g. models/flan-t5-large-onnx-int8
+        self.artifact_prefix = artifact_prefix or f"models/{model_name.split('/')[-1]}-onnx{'-int8' if quantize else ''}"
+        self.batch_size = batch_size
+        self.device = "cpu"
+        self.local_dir = os.path.join(os.path.expanduser(cache_dir), self.artifact_prefix)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        if not self._download_artifacts():
+            self._export(model_name, quantize)
+            self._upload_artifacts()
+
+        suffix = "_quantized" if quantize else ""
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.model = ORTModelForSeq2SeqLM.from_pretrained(
+            self.local_dir,
+            encoder_file_name=f"encoder_model{suffix}.onnx",
+            decoder_file_name=f"decoder_model{suffix}.onnx",
+            decoder_with_past_file_name=f"decoder_with_past_model{suffix}.onnx",
+            session_options=session_options,
+            provider="CPUExecutionProvider",
+        )
+
+    def generate(self, context, query):
+        prompt = self.gen_prompt_few_shot(context, query)
+        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512)
+        outputs = self.model.generate(**inputs, max_new_tokens=250)
+        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+
+    def generate_batch(self, contexts, queries):
+        prompts = [self.gen_prompt_few_shot(c, q) for c, q in zip(contexts, queries)]
+        answers = []
+        for start in range(0, len(prompts), self.batch_size):
+            inputs = self.tokenizer(prompts[start:start + self.batch_size], return_tensors="pt", padding=True,
+                                    truncation=True, max_length=512)
+            outputs = self.model.generate(**inputs, max_new_tokens=250)
+            answers.extend(self.tokenizer.batch_decode(outputs, skip_special_tokens=True))
+        return answers
+
+    def generate_stream(self, context, query):
+        prompt = self.gen_prompt_few_shot(context, query)
+        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=512)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(self.model.generate(**inputs, max_new_tokens=250, streamer=streamer))
+            except BaseException as e:
+                future.set_exception(e)
+                # a failed generate never reaches its own end(), which would leave the consumer waiting
+                streamer.end()
+
+        Thread(target=run, daemon=True).start()
+        yield from streamer
+        # re-raise a decoding error that ended the stream early
+        future.result()
+
+    def _export(self, model_name, quantize):
+        with tempfile.TemporaryDirectory() as export_dir:
+            print(f"⚙️ Exporting {model_name} to ONNX")
+            ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True).save_pretrained(export_dir)
+            os.makedirs(self.local_dir, exist_ok=True)
+            if quantize:
+                # weights become int8, activations are quantized on the fly; AVX2 runs on any recent x86
+                config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+                for file_name in ONNX_FILES:
+                    quantizer = ORTQuantizer.from_pretrained(export_dir, file_name=file_name)
+                    quantizer.quantize(save_dir=self.local_dir, quantization_config=config)
+            for file_name in os.listdir(export_dir):
+                # configs always, full-precision graphs only when they are what gets served
+                if not file_name.endswith(".onnx") or not quantize:
+                    shutil.copy(os.path.join(export_dir, file_name), os.path.join(self.local_dir, file_name))
+
+    def _download_artifacts(self):
+        manifest_path = f"{self.artifact_prefix}/export.json"
+        if not self.blobstore.exists(manifest_path):
+            return False
+        os.makedirs(self.local_dir, exist_ok=True)
+        files = json.loads(self.blobstore.read_file(manifest_path))["files"]
+        self.blobstore.download_many({
+            f"{self.artifact_prefix}/{file_name}": os.path.join(self.local_dir, file_name)
+            for file_name in files if not os.path.exists(os.path.join(self.local_dir, file_name))
+        })
+        return True
+
+    def _upload_artifacts(self):
+        files = sorted(os.listdir(self.local_dir))
+        for file_name in files:
+            self.blobstore.upload_file(os.path.join(self.local_dir, file_name), f"{self.artifact_prefix}/{file_name}")
+        # written last, so a half-finished upload is never picked up
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, "export.json")
+            with open(fp, "w") as f:
+                json.dump({"files": files}, f)
+            self.blobstore.upload_file(fp, f"{self.artifact_prefix}/export.json")
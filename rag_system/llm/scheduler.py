@@ -0,0 +1,187 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import torch
+import torch.nn.functional as F
+from utils.forksafe import after_fork
+
+class GenerationScheduler:
+    """Continuous batching for seq2seq models: one worker thread decodes all pending prompts step by step.
+
+    Prompts are queued by `submit` and admitted into the running batch at step boundaries, up to
+    `max_batch_size` rows; an idle worker waits `max_wait` seconds for more prompts before starting.
+    Sequences that finish leave the batch right away, so short answers don't wait for long ones.
+    Decoding is greedy, matching `model.generate` with the default generation config. A prompt submitted
+    with a streamer (e.g. transformers' TextIteratorStreamer) also gets each token as it is decoded.
+    """
+
+    def __init__(self, model, tokenizer, device, max_batch_size=8, max_wait=0.01, max_new_tokens=250,
+                 max_input_length=512):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_new_tokens = max_new_tokens
+        self.max_input_length = max_input_length
+        self.eos_token_id = model.config.eos_token_id
+        self.start_token_id = model.config.decoder_start_token_id
+        self._start()
+        after_fork(self._start)
+
+    def _start(self):
+        self.requests = queue.Queue()
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._run, daemon=True, name="generation-scheduler")
+        self._worker.start()
+
+    def submit(self, prompt: str, streamer=None) -> Future:
+        future = Future()
+        self.requests.put((prompt, future, streamer))
+        return future
+
+    def close(self):
+        self._stop.set()
+        self.requests.put(None)
+        self._worker.join()
+
+    def _run(self):
+        batch, new = None, []
+        with torch.no_grad():
+            while not self._stop.is_set():
+                try:
+                    room = self.max_batch_size - (len(batch["rows"]) if batch else 0)
+                    # block only when there is nothing to decode
+                    new = self._collect(room, wait=batch is None)
+                    if batch is not None:
+                        batch = self._retire(self._forward(batch))
+                    if new:
+                        batch = self._admit(batch, new)
+                except Exception as e:
+                    rows = [(future, streamer) for _, future, streamer in new] + (batch["rows"] if batch else [])
+                    for future, streamer in rows:
+                        if not future.done():
+                            future.set_exception(e)
+                        if streamer is not None:
+                            streamer.end()
+                    batch = None
+                new = []
+
+    def _collect(self, room, wait):
+        items = []
+        if wait:
+            item = self.requests.get()
+            if item is None:
+                return items
+            items.append(item)
+            # give concurrent callers a short window to join the first step
+            deadline = time.monotonic() + self.max_wait
+        while len(items) < room:
+            try:
+                if wait:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    item = self.requests.get(timeout=remaining)
+                else:
+                    item = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            items.append(item)
+        return items
+
+    def _admit(self, batch, new):
+        prompts = [prompt for prompt, _, _ in new]
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=True,
+                                max_length=self.max_input_length).to(self.device)
+        start = torch.full((len(prompts), 1), self.start_token_id, dtype=torch.long, device=self.device)
+        joined = {
+            "rows": [(future, streamer) for _, future, streamer in new],
+            "tokens": [[] for _ in prompts],
+            "encoder_hidden": self.model.get_encoder()(**inputs).last_hidden_state,
+            "encoder_mask": inputs["attention_mask"],
+            "decoder_mask": torch.ones_like(start),
+            "next_input": start,
+            "past": None,
+        }
+        # newcomers take their first step on their own, then are padded into the running batch
+        joined = self._retire(self._forward(joined))
+        if batch is None or joined is None:
+            return batch or joined
+        return self._merge(batch, joined)
+
+    def _forward(self, batch):
+        outputs = self.model(
+            encoder_outputs=(batch["encoder_hidden"],),
+            attention_mask=batch["encoder_mask"],
+            decoder_input_ids=batch["next_input"],
+            decoder_attention_mask=batch["decoder_mask"],
+            past_key_values=batch["past"],
+            use_cache=True,
+        )
+        next_tokens = outputs.logits[:, -1, :].argmax(dim=-1)
+        for tokens, (_, streamer), token in zip(batch["tokens"], batch["rows"], next_tokens.tolist()):
+            tokens.append(token)
+            if streamer is not None:
+                streamer.put(torch.tensor([token]))
+        batch["past"] = outputs.past_key_values
+        batch["next_input"] = next_tokens.unsqueeze(-1)
+        # the mask always covers the cached positions plus the next input
+        batch["decoder_mask"] = F.pad(batch["decoder_mask"], (0, 1), value=1)
+        return batch
+
+    def _retire(self, batch):
+        """Resolve finished rows and drop them from every batched tensor."""
+        keep = []
+        for row, (tokens, (future, streamer)) in enumerate(zip(batch["tokens"], batch["rows"])):
+            if tokens and (tokens[-1] == self.eos_token_id or len(tokens) >= self.max_new_tokens):
+                future.set_result(self.tokenizer.decode(tokens, skip_special_tokens=True))
+                if streamer is not None:
+                    streamer.end()
+            else:
+                keep.append(row)
+        if not keep:
+            return None
+        if len(keep) == len(batch["rows"]):
+            return batch
+        index = torch.tensor(keep, device=self.device)
+        return {
+            "rows": [batch["rows"][row] for row in keep],
+            "tokens": [batch["tokens"][row] for row in keep],
+            "encoder_hidden": batch["encoder_hidden"].index_select(0, index),
+            "encoder_mask": batch["encoder_mask"].index_select(0, index),
+            "decoder_mask": batch["decoder_mask"].index_select(0, index),
+            "next_input": batch["next_input"].index_select(0, index),
+            "past": tuple(tuple(t.index_select(0, index) for t in layer) for layer in batch["past"]),
+        }
+
+    def _merge(self, a, b):
+        """Concatenate two batches; decoder caches are left-padded, encoder states right-padded, all masked."""
+        dec_len = max(a["decoder_mask"].shape[1], b["decoder_mask"].shape[1])
+        enc_len = max(a["encoder_mask"].shape[1], b["encoder_mask"].shape[1])
+
+        def left(t, dim_from_end, length=dec_len):
+            return F.pad(t, (0, 0) * dim_from_end + (length - t.shape[-1 - dim_from_end], 0))
+
+        def right(t, dim_from_end):
+            return F.pad(t, (0, 0) * dim_from_end + (0, enc_len - t.shape[-1 - dim_from_end]))
+
+        past = []
+        for layer_a, layer_b in zip(a["past"], b["past"]):
+            # (self key, self value, cross key, cross value), each (batch, heads, length, head_dim)
+            self_kv = [torch.cat([left(x, 1, dec_len - 1), left(y, 1, dec_len - 1)])
+                       for x, y in zip(layer_a[:2], layer_b[:2])]
+            cross_kv = [torch.cat([right(x, 1), right(y, 1)]) for x, y in zip(layer_a[2:], layer_b[2:])]
+            past.append(tuple(self_kv + cross_kv))
+        return {
+            "rows": a["rows"] + b["rows"],
+            "tokens": a["tokens"] + b["tokens"],
+            "encoder_hidden": torch.cat([right(a["encoder_hidden"], 1), right(b["encoder_hidden"], 1)]),
+            "encoder_mask": torch.cat([right(a["encoder_mask"], 0), right(b["encoder_mask"], 0)]),
+            "decoder_mask": torch.cat([left(a["decoder_mask"], 0), left(b["decoder_mask"], 0)]),
+            "next_input": torch.cat([a["next_input"], b["next_input"]]),
+            "past": tuple(past),
+        }
@@ -0,0 +1,106 @@
+import re
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from typing import Callable
+from .orchestrator import RAGOrchestrator
+
+COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+class CollectionManager:
+    """Serves many named collections from one process, keeping the most recently used ones loaded.
+
+    `factory(name)` builds the orchestrator for a collection (its own blobstore prefix and cache
+    directory, shared embedder/LLM). Collections are initialized on first use; once the loaded
+    indexes exceed `memory_budget_bytes`, idle collections are closed least recently used first.
+    """
+
+    def __init__(self, factory: Callable[[str], RAGOrchestrator], memory_budget_bytes: int):
+        self.factory = factory
+        self.memory_budget_bytes = memory_budget_bytes
+        self.collections = OrderedDict()  # name -> orchestrator, least recently used first
+        self.in_use = {}                  # name -> number of requests currently using it
+        self.lock = threading.Lock()
+        self.loading = {}                 # name -> lock held while the collection initializes
+
+    @contextmanager
+    def use(self, name: str):
+        orchestrator = self._acquire(name)
+        try:
+            yield orchestrator
+        finally:
+            with self.lock:
+                self.in_use[name] -= 1
+            self._evict()
+
+    def query(self, name: str, query: str, top_k: int = 3, filters: dict = None):
+        with self.use(name) as orchestrator:
+            return orchestrator.query(query, top_k, filters)
+
+    def query_stream(self, name: str, query: str, top_k: int = 3, filters: dict = None):
+        # the collection stays pinned until the token stream is exhausted or closed
+        with ExitStack() as stack:
+            orchestrator = stack.enter_context(self.use(name))
+            context, tokens = orchestrator.query_stream(query, top_k, filters)
+            release = stack.pop_all()
+
+        def pinned():
+            with release:
+                yield from tokens
+
+        return context, pinned()
+
+    def query_batch(self, name: str, queries: list, top_k: int = 3, filters: dict = None):
+        with self.use(name) as orchestrator:
+            return orchestrator.query_batch(queries, top_k, filters)
+
+    def status(self):
+        with self.lock:
+            return {
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "collections": {name: o.memory_footprint() for name, o in self.collections.items()},
+            }
+
+    def _acquire(self, name):
+        if not COLLECTION_NAME.match(name):
+            raise ValueError(f"Invalid collection name: {name}")
+        with self.lock:
+            if name in self.collections:
+                self.collections.move_to_end(name)
+                self.in_use[name] += 1
+                return self.collections[name]
+            loading = self.loading.setdefault(name, threading.Lock())
+
+        # initialize outside the manager lock so other collections keep serving
+        with loading:
+            with self.lock:
+                if name in self.collections:
+                    self.collections.move_to_end(name)
+                    self.in_use[name] += 1
+                    return self.collections[name]
+            orchestrator = self.factory(name)
+            orchestrator.initialize()
+            with self.lock:
+                self.collections[name] = orchestrator
+                self.in_use[name] = 1
+                self.loading.pop(name, None)
+        print(f"📂 Loaded collection '{name}' ({orchestrator.memory_footprint() / 2**20:.1f} MiB)")
+        return orchestrator
+
+    def _evict(self):
+        evicted = []
+        with self.lock:
+            total = sum(o.memory_footprint() for o in self.collections.values())
+            for name in list(self.collections):
+                if total <= self.memory_budget_bytes:
+                    break
+                # never close a collection a request is still using
+                if self.in_use[name]:
+                    continue
+                orchestrator = self.collections.pop(name)
+                del self.in_use[name]
+                total -= orchestrator.memory_footprint()
+                evicted.append((name, orchestrator))
+        for name, orchestrator in evicted:
+            orchestrator.close()
+            print(f"♻️ Evicted collection '{name}'")
@@ -0,0 +1,278 @@
+import itertools
+import os
+import posixpath
+import tempfile
+import threading
+from blobstore.base import BlobStore
+from document_processor.base import DocumentProcessor
+from document_processor.dedup import ChunkDeduplicator
+from embedding.base import EmbeddingModel
+from vectordb.base import VectorDB
+from vectordb.manifest import IndexManifest
+from utils.forksafe import after_fork
+from utils.pipeline import prefetch
+
+class IncrementalIndexer:
+    """Keeps the vector index in step with the blobstore, re-embedding only files that changed."""
+
+    def __init__(self, blobstore: BlobStore, processor: DocumentProcessor, embedder: EmbeddingModel,
+                 vectordb: VectorDB, index_options: dict = None, compact_ratio: float = 0.2,
+                 batch_size: int = 256, queue_size: int = 4, dedup_options: dict = None):
+        self.blobstore = blobstore
+        self.processor = processor
+        self.embedder = embedder
+        self.vectordb = vectordb
+        self.index_options = index_options or {}
+        self.manifest = IndexManifest.for_index(blobstore, vectordb.index_path)
+        # HNSW tombstones are purged once they exceed this fraction of the index
+        self.compact_ratio = compact_ratio
+        # rebuilds embed `batch_size` chunks at a time, with at most `queue_size` items waiting between stages
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        # ChunkDeduplicator settings; exact repeats only unless a near-duplicate threshold is given,
+        # False keeps every chunk
+        self.dedup_options = dedup_options
+        # every chunk in the index under the file that owns it; see _loaded_dedup
+        self.dedup = None
+        # serializes mutations (sync, live updates, persistence); queries are not blocked by it
+        self.lock = threading.Lock()
+        self.pending_changes = 0
+        self._stop = threading.Event()
+        self._interval = None
+        after_fork(self._restart_maintenance)
+
+    def sync(self):
+        checksums = self._checksums()
+        self.dedup = None
+        if not (self.vectordb.load() and self.manifest.load()):
+            self.rebuild(checksums)
+            return
+        if self.vectordb.params.get("index_type") != self.index_options.get("index_type", "flat"):
+            print("⚠️ Index type changed, rebuilding from scratch")
+            self.rebuild(checksums)
+            return
+
+        added, changed, removed = self.manifest.diff(checksums)
+        if not (added or changed or removed):
+            return
+
+        self.vectordb.ensure_writable()
+        dedup = self._loaded_dedup()
+        dependents = self._release(changed + removed, dedup)
+        for path in removed:
+            self.manifest.drop(path)
+        self._index_files(added + changed + dependents, checksums, dedup)
+
+        self.persist()
+        if self.vectordb.mmap:
+            self.vectordb.load()
+        print(f"🔄 Re-indexed {len(added)} added, {len(changed)} changed, {len(removed)} removed files"
+              f" and {len(dependents)} whose duplicates they held")
+
+    def rebuild(self, checksums=None):
+        checksums = self._checksums() if checksums is None else checksums
+        paths, spans = list(checksums), []
+        dedup = self._deduplicator()
+        # parse, embed and add run as concurrent stages joined by bounded queues, so only a few
+        # files and batches are held in memory however large the corpus is
+        files = prefetch(self.processor.process_files(paths), maxsize=self.queue_size, name="ingest-parse")
+        batches = prefetch(self._embedded_batches(paths, files, spans, dedup), maxsize=self.queue_size,
+                           name="ingest-embed")
+        try:
+            first = next(batches, None)
+            if first is None:
+                raise ValueError("No supported documents found to index")
+            self.vectordb.build_index_stream(itertools.chain([first], batches), **self.index_options)
+        finally:
+            # stops the upstream stages early if the build failed
+            batches.close()
+            files.close()
+        self.manifest.files = {}
+        for path, start, count, stats in spans:
+            self.manifest.record(path, checksums[path], list(range(start, start + count)), stats)
+        self.dedup = dedup
+        self._update_dedup_report()
+        if self.manifest.dedup:
+            self._print_dedup_report(self.manifest.dedup)
+        self.manifest.save()
+        self.embedder.save()
+
+    def upsert_file(self, path, text=None):
+        """(Re)index one file in place; `text` is first written to the blobstore as the file's content."""
+        path = self._document_path(path)
+        if not self.processor.supports(path):
+            raise ValueError(f"Unsupported file type: {path}")
+        if text is not None and os.path.splitext(path)[1].lower() != ".txt":
+            raise ValueError(f"Inline text can only be stored as a .txt document: {path}")
+        if text is not None:
+            self._write_text(path, text)
+        with self.lock:
+            self.vectordb.ensure_writable()
+            dedup = self._loaded_dedup()
+            dependents = self._release([path], dedup)
+            ids = self._index_file(path, self.blobstore.checksum(path), self.processor.process_file(path), dedup)
+            self._index_files(dependents, self._recorded_checksums(dependents), dedup)
+            self.pending_changes += 1
+        return {"source": path, "chunks": len(ids)}
+
+    def delete_file(self, path):
+        path = self._document_path(path)
+        with self.lock:
+            if path not in self.manifest.files:
+                raise KeyError(path)
+            self.vectordb.ensure_writable()
+            dedup = self._loaded_dedup()
+            dependents = self._release([path], dedup)
+            self.manifest.drop(path)
+            self._index_files(dependents, self._recorded_checksums(dependents), dedup)
+            self.pending_changes += 1
+        # drop the source too, otherwise the next startup sync would index it again
+        if self.blobstore.exists(path):
+            self.blobstore.delete_file(path)
+        return {"source": path, "deleted": True}
+
+    def persist(self):
+        with self.lock:
+            if self.vectordb.tombstone_ratio() > self.compact_ratio:
+                self.vectordb.compact()
+            self.vectordb.save()
+            self._update_dedup_report()
+            self.manifest.save()
+            self.embedder.save()
+            self.pending_changes = 0
+
+    def start_maintenance(self, interval: float = 60.0):
+        """Compact and persist live updates every `interval` seconds in a daemon thread."""
+        self._interval = interval
+
+        def loop():
+            while not self._stop.wait(interval):
+                if self.pending_changes:
+                    try:
+                        self.persist()
+                    except Exception as e:
+                        print(f"🔥 Error persisting index: {e}")
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def stop_maintenance(self):
+        self._stop.set()
+
+    def _restart_maintenance(self):
+        self.lock = threading.Lock()
+        if self._interval is not None and not self._stop.is_set():
+            self.start_maintenance(self._interval)
+
+    def _index_file(self, path, checksum, chunks, dedup=None):
+        chunks, stats = self._unique(dedup, path, chunks)
+        ids = self.vectordb.add(self._embed(chunks), chunks) if chunks else []
+        self.manifest.record(path, checksum, ids, stats)
+        return ids
+
+    def _index_files(self, paths, checksums, dedup=None):
+        for path, chunks in zip(paths, self.processor.process_files(paths)):
+            self._index_file(path, checksums[path], chunks, dedup)
+
+    def _recorded_checksums(self, paths):
+        return {path: self.manifest.files[path]["checksum"] for path in paths}
+
+    def _release(self, paths, dedup):
+        """Take `paths` out of the index, together with every file whose dropped duplicates repeat
+        chunks they own; returns those other files, which must be indexed again."""
+        dependents = self.manifest.dependents(paths) if dedup else []
+        stale = [path for path in list(paths) + dependents if path in self.manifest.files]
+        self.vectordb.remove(self.manifest.ids_for(stale))
+        if dedup:
+            for path in stale:
+                dedup.forget(path)
+        return dependents
+
+    @staticmethod
+    def _document_path(path):
+        # client-supplied sources must name a file inside the blobstore, in the form listings use
+        normalized = posixpath.normpath(path.replace("\\", "/"))
+        if posixpath.isabs(normalized) or normalized == "." or normalized.split("/")[0] == "..":
+            raise ValueError(f"Invalid document path: {path}")
+        return normalized
+
+    def _write_text(self, path, text):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, os.path.basename(path))
+            with open(fp, "w", encoding="utf-8") as f:
+                f.write(text)
+            self.blobstore.upload_file(fp, path)
+
+    def _checksums(self):
+        return self.blobstore.list_checksums(include=self.processor.supports)
+
+    def _embedded_batches(self, paths, files, spans, dedup=None):
+        """Regroup per-file chunks into (embeddings, chunks, ids) batches of `batch_size`, appending
+        each file's (path, first id, chunk count, dedup stats) to `spans`. Duplicates are dropped before
+        embedding."""
+        batch, start = [], 0
+        # files come back in path order, so ids are the same however many workers extract them
+        for path, chunks in zip(paths, files):
+            chunks, stats = self._unique(dedup, path, chunks)
+            spans.append((path, start + len(batch), len(chunks), stats))
+            batch.extend(chunks)
+            while len(batch) >= self.batch_size:
+                chunk_batch, batch = batch[:self.batch_size], batch[self.batch_size:]
+                yield self._embed(chunk_batch), chunk_batch, range(start, start + len(chunk_batch))
+                start += len(chunk_batch)
+        if batch:
+            yield self._embed(batch), batch, range(start, start + len(batch))
+
+    def _deduplicator(self):
+        return None if self.dedup_options is False else ChunkDeduplicator(**(self.dedup_options or {}))
+
+    @staticmethod
+    def _unique(dedup, path, chunks):
+        """(kept chunks, the file's dedup stats). Duplicates are dropped across the whole corpus; the
+        stats name the files holding the kept copies, so removing one re-indexes the files relying on it."""
+        if not dedup:
+            return chunks, None
+        before = dict(dedup.stats)
+        kept = dedup.filter(chunks, owner=path)
+        stats = {key: dedup.stats[key] - before[key] for key in before}
+        stats["repeats"] = sorted(dedup.repeats.get(path, ()))
+        return kept, stats
+
+    def _loaded_dedup(self):
+        # after a load the deduplicator is refilled from the stored chunk texts, the first time an
+        # update needs it; None when deduplication is off
+        if self.dedup_options is False:
+            return None
+        if self.dedup is None:
+            dedup = self._deduplicator()
+            for path in self.manifest.files:
+                for doc in self.vectordb.get_documents(self.manifest.ids_for([path])):
+                    if doc:
+                        dedup.add(doc["text"], owner=path)
+            self.dedup = dedup
+        return self.dedup
+
+    def _update_dedup_report(self):
+        totals = self.manifest.dedup_totals() if self.dedup_options is not False else None
+        self.manifest.dedup = self._dedup_report(totals) if totals else None
+
+    def _dedup_report(self, stats):
+        dropped = stats["exact_duplicates"] + stats["near_duplicates"]
+        footprint = self.vectordb.memory_footprint()
+        # what the skipped chunks would have cost at the built index's bytes per vector
+        bytes_per_vector = footprint["index_bytes"] / footprint["vectors"] if footprint["vectors"] else 0
+        return {
+            **stats,
+            "embedding_input_saved": stats["duplicate_chars"] / stats["chars"] if stats["chars"] else 0.0,
+            "index_bytes_saved": int(dropped * bytes_per_vector),
+        }
+
+    @staticmethod
+    def _print_dedup_report(report):
+        dropped = report["exact_duplicates"] + report["near_duplicates"]
+        print(f"🧹 Skipped {dropped} of {report['chunks']} chunks as duplicates "
+              f"({report['exact_duplicates']} exact, {report['near_duplicates']} near): "
+              f"{report['embedding_input_saved']:.1%} less text to embed, "
+              f"~{report['index_bytes_saved'] / 2**20:.1f} MiB smaller index")
+
+    def _embed(self, chunks):
+        return self.embedder.embed([c["text"] for c in chunks])
@@ -1,10 +1,182 @@
-from abc import ABC, abstractmethod
+import os
+import threading
+from abc import ABC
+from blobstore.base import BlobStore
+from document_processor.simple_processor import SimpleDocumentProcessor
+from embedding.base import EmbeddingModel
+from embedding.cached_embedding import CachedEmbedding
+from embedding.sentence_transformer import SentenceTransformerEmbedding
+from vectordb.faiss_db import FAISSVectorDB
+from vectordb.sharded_db import ShardedVectorDB
+from vectordb.snapshots import IndexSnapshots
+from llm.base import LLMModel
+from llm.flan_t5 import FlanT5
+from query.rag_query_engine import RAGQueryEngine
+from query.context_packer import ContextPacker
+from query.semantic_cache import SemanticCache
+from .indexer import IncrementalIndexer
+
+class WritesDisabled(RuntimeError):
+    """Raised for index updates on an orchestrator that serves a shared, read-only index."""
 
 class RAGOrchestrator(ABC):
-    @abstractmethod
+    def __init__(self, blobstore: BlobStore, index_path: str, index_options: dict = None,
+                 mmap_index: bool = False, persist_interval: float = 60.0, num_shards: int = 1,
+                 embedder: EmbeddingModel = None, llm: LLMModel = None, cache_dir: str = "~/.cache/rag_system",
+                 answer_cache_options: dict = None, llm_backend: str = "pytorch", compress_context: bool = False,
+                 dedup_options: dict = None):
+        self.blobstore = blobstore
+        self.processor = SimpleDocumentProcessor(self.blobstore)
+        # models can be shared between orchestrators serving different collections
+        self.embedder = embedder or CachedEmbedding(
+            SentenceTransformerEmbedding(),
+            path=os.path.join(cache_dir, "embeddings.db"),
+            blobstore=self.blobstore,
+            remote_path=os.path.join(os.path.dirname(index_path), "embeddings.db"),
+        )
+        self.llm = llm or self._load_llm(llm_backend, cache_dir)
+        self.index_options = index_options or {}
+        self.mmap_index = mmap_index
+        self.persist_interval = persist_interval
+        self.num_shards = num_shards
+        # local copies of index files; must not be shared between collections
+        self.cache_dir = cache_dir
+        # SemanticCache settings (threshold, max_entries, ttl), {} for the defaults; off unless given
+        self.answer_cache_options = answer_cache_options
+        # keep only query-relevant sentences of each retrieved chunk
+        self.compress_context = compress_context
+        # ChunkDeduplicator settings for indexing; exact repeats only unless a threshold is given
+        # for near-duplicates (e.g. {"threshold": 0.8}); False keeps duplicate chunks
+        self.dedup_options = dedup_options
+        self.snapshots = IndexSnapshots(self.blobstore, index_path)
+        self.version = None
+        self.vectordb = None
+        self.indexer = None
+        self.query_engine = None
+        self._rebuild_thread = None
+        # cleared by app.prefork: forked workers each hold their own copy of the index but share its
+        # local docstore and blobstore files, so independent updates would hand out clashing ids
+        self.accept_writes = True
+
     def initialize(self):
-        pass
+        self.version = self.snapshots.current()
+        fresh = self.version is None
+        if fresh:
+            self.version = 0
+        self.vectordb, self.indexer = self._open_version(self.version)
+        self.indexer.sync()
+        if fresh:
+            self.snapshots.publish(self.version)
+        self.indexer.start_maintenance(self.persist_interval)
+        cache = None if self.answer_cache_options in (None, False) else SemanticCache(**self.answer_cache_options)
+        packer = ContextPacker(self.llm, compress=self.compress_context)
+        self.query_engine = RAGQueryEngine(self.embedder, self.vectordb, self.llm, cache, packer)
+
+    def is_ready(self) -> bool:
+        return self.query_engine is not None
+
+    def dedup_stats(self):
+        """Chunks of the indexed files left out as duplicates, with the embedding and index savings, as of
+        the last persist."""
+        return self.indexer.manifest.dedup if self.indexer else None
+
+    def memory_footprint(self) -> int:
+        return self.vectordb.memory_footprint()["index_bytes"] if self.is_ready() else 0
+
+    def close(self):
+        """Persist pending live updates and release the index."""
+        if not self.query_engine:
+            return
+        self.indexer.stop_maintenance()
+        if self.indexer.pending_changes:
+            self.indexer.persist()
+        # wait for in-flight retrievals before the docstore goes away
+        with self.query_engine.index_lock.write():
+            self.vectordb.close()
+        self.query_engine = None
+
+    def query(self, query: str, top_k: int = 3, filters: dict = None) -> str:
+        if not self.query_engine:
+            raise RuntimeError("RAG system not initialized.")
+        return self.query_engine.query(query, top_k, filters)
+
+    def query_stream(self, query: str, top_k: int = 3, filters: dict = None):
+        if not self.query_engine:
+            raise RuntimeError("RAG system not initialized.")
+        return self.query_engine.query_stream(query, top_k, filters)
+
+    def query_batch(self, queries: list, top_k: int = 3, filters: dict = None) -> list:
+        if not self.query_engine:
+            raise RuntimeError("RAG system not initialized.")
+        return self.query_engine.query_batch(queries, top_k, filters)
+
+    def upsert_document(self, source: str, text: str = None) -> dict:
+        if not self.query_engine:
+            raise RuntimeError("RAG system not initialized.")
+        self._check_writable()
+        result = self.indexer.upsert_file(source, text)
+        self.query_engine.invalidate_cache()
+        return result
+
+    def delete_document(self, source: str) -> dict:
+        if not self.query_engine:
+            raise RuntimeError("RAG system not initialized.")
+        self._check_writable()
+        result = self.indexer.delete_file(source)
+        self.query_engine.invalidate_cache()
+        return result
+
+    def rebuild(self) -> int:
+        """Build the next index version in a background thread; queries keep using the current one."""
+        if not self.query_engine:
+            raise RuntimeError("RAG system not initialized.")
+        self._check_writable()
+        if self._rebuild_thread and self._rebuild_thread.is_alive():
+            raise RuntimeError("An index rebuild is already running.")
+        version = self.version + 1
+        self._rebuild_thread = threading.Thread(target=self._rebuild, args=(version,), daemon=True)
+        self._rebuild_thread.start()
+        return version
+
+    def _rebuild(self, version):
+        try:
+            vectordb, indexer = self._open_version(version)
+            indexer.rebuild()
+            old_indexer = self.indexer
+            # hold off live updates to the old version while catching up and switching over
+            with old_indexer.lock:
+                indexer.sync()
+                self.snapshots.publish(version)
+                self.query_engine.swap_vectordb(vectordb)
+                self.version, self.vectordb, self.indexer = version, vectordb, indexer
+            old_indexer.stop_maintenance()
+            indexer.start_maintenance(self.persist_interval)
+            print(f"✅ Switched to index version {version}")
+        except Exception as e:
+            print(f"🔥 Error rebuilding index version {version}: {e}")
+
+    def _check_writable(self):
+        if not self.accept_writes:
+            raise WritesDisabled("Index updates are disabled while serving from pre-forked workers; "
+                                 "run a single process to update documents or rebuild.")
+
+    def _load_llm(self, backend, cache_dir):
+        if backend == "pytorch":
+            return FlanT5()
+        if backend == "onnx":
+            # optional dependency (optimum[onnxruntime]), only needed for this backend
+            from llm.flan_t5_onnx import FlanT5Onnx
+            return FlanT5Onnx(self.blobstore, cache_dir=cache_dir)
+        raise ValueError(f"Unknown LLM backend: {backend}")
 
-    @abstractmethod
-    def query(self, query: str, top_k: int) -> str:
-        pass
+    def _open_version(self, version):
+        index_path = self.snapshots.path_for(version)
+        if self.num_shards > 1:
+            vectordb = ShardedVectorDB(blobstore=self.blobstore, index_path=index_path, num_shards=self.num_shards,
+                                       mmap=self.mmap_index, cache_dir=self.cache_dir)
+        else:
+            vectordb = FAISSVectorDB(blobstore=self.blobstore, index_path=index_path, mmap=self.mmap_index,
+                                     cache_dir=self.cache_dir)
+        indexer = IncrementalIndexer(self.blobstore, self.processor, self.embedder, vectordb, self.index_options,
+                                     dedup_options=self.dedup_options)
+        return vectordb, indexer
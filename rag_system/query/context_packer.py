@@ -0,0 +1,56 @@
+import re
+from llm.base import LLMModel
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"[a-z0-9$%]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from had has have how in is it its of on or that the "
+    "this to was were what when where which who why will with".split()
+)
+
+class ContextPacker:
+    """Fits retrieved chunks into the LLM's context budget instead of letting the tokenizer truncate them.
+
+    Chunks arrive in rank order and are taken best first; a chunk that doesn't fit whole contributes
+    its leading sentences that do, and lower-ranked chunks fill whatever room is left. With `compress`,
+    each chunk is first reduced to the sentences sharing a content word with the query (chunks with no
+    overlap are kept whole, since they matched on meaning rather than wording).
+    """
+
+    def __init__(self, llm: LLMModel, compress: bool = False):
+        self.llm = llm
+        self.compress = compress
+
+    def pack(self, query: str, chunks: list) -> str:
+        budget = self.llm.context_budget(query)
+        if budget is None:
+            return "\n".join(chunks)
+        terms = self._terms(query)
+        separator = self.llm.count_tokens("\n") or 1
+        packed = []
+        for chunk in chunks:
+            sentences = SENTENCE_END.split(chunk.strip())
+            if self.compress:
+                relevant = [s for s in sentences if terms & self._terms(s)]
+                sentences = relevant or sentences
+            available = budget - (separator if packed else 0)
+            text = " ".join(sentences)
+            cost = self.llm.count_tokens(text)
+            if cost > available:
+                # too long as a whole: keep its leading sentences that still fit
+                kept, cost = [], 0
+                for sentence in sentences:
+                    sentence_cost = self.llm.count_tokens(sentence) + (1 if kept else 0)
+                    if cost + sentence_cost > available:
+                        break
+                    kept.append(sentence)
+                    cost += sentence_cost
+                text = " ".join(kept)
+            if text:
+                packed.append(text)
+                budget = available - cost
+        return "\n".join(packed)
+
+    @staticmethod
+    def _terms(text):
+        return {w for w in WORD.findall(text.lower()) if w not in STOPWORDS}
@@ -1,16 +1,87 @@
 from embedding.base import EmbeddingModel
 from vectordb.base import VectorDB
 from llm.base import LLMModel
+from utils.rwlock import RWLock
+from .context_packer import ContextPacker
+from .semantic_cache import SemanticCache
 
 class RAGQueryEngine:
-    def __init__(self, embedder: EmbeddingModel, vectordb: VectorDB, llm: LLMModel):
+    def __init__(self, embedder: EmbeddingModel, vectordb: VectorDB, llm: LLMModel, cache: SemanticCache = None,
+                 packer: ContextPacker = None):
         self.embedder = embedder
         self.vectordb = vectordb
         self.llm = llm
+        # fits the retrieved chunks into the LLM's input window, best ranked first
+        self.packer = packer or ContextPacker(llm)
+        # answers for near-duplicate questions; None disables the cache
+        self.cache = cache
+        # retrieval reads the index under the read side, swap_vectordb takes the write side
+        self.index_lock = RWLock()
 
-    def query(self, query_text: str, top_k=3):
-        q_embedding = self.embedder.embed([query_text])[0]
-        context_chunks = self.vectordb.query(q_embedding, top_k)
-        context = "\n".join(context_chunks)
+    def swap_vectordb(self, vectordb: VectorDB):
+        # waits only for in-flight retrievals, not generations, so the switch adds no latency spike
+        with self.index_lock.write():
+            self.vectordb = vectordb
+        self.invalidate_cache()
+
+    def invalidate_cache(self):
+        if self.cache:
+            self.cache.invalidate()
+
+    def query(self, query_text: str, top_k=3, filters: dict = None):
+        q_embedding = self.embedder.embed_queries([query_text])[0]
+        cached = self.cache.get(query_text, q_embedding, top_k, filters) if self.cache else None
+        if cached:
+            return cached
+        generation = self.cache.generation if self.cache else None
+        with self.index_lock.read():
+            context_chunks = self.vectordb.query(q_embedding, top_k, filters=filters)
+        context = self.packer.pack(query_text, context_chunks)
         respone = self.llm.generate(context, query_text)
-        return {"context": context, "response": respone}
+        result = {"context": context, "response": respone}
+        if self.cache:
+            self.cache.put(query_text, q_embedding, top_k, filters, result, generation)
+        return result
+
+    def query_stream(self, query_text: str, top_k=3, filters: dict = None):
+        """Retrieve eagerly and return (context, iterator over answer text pieces)."""
+        q_embedding = self.embedder.embed_queries([query_text])[0]
+        cached = self.cache.get(query_text, q_embedding, top_k, filters) if self.cache else None
+        if cached:
+            return cached["context"], iter([cached["response"]])
+        generation = self.cache.generation if self.cache else None
+        with self.index_lock.read():
+            context_chunks = self.vectordb.query(q_embedding, top_k, filters=filters)
+        context = self.packer.pack(query_text, context_chunks)
+        tokens = self.llm.generate_stream(context, query_text)
+        if not self.cache:
+            return context, tokens
+
+        def caching():
+            # only a stream that ran to the end is a complete answer worth caching
+            pieces = []
+            for text in tokens:
+                pieces.append(text)
+                yield text
+            self.cache.put(query_text, q_embedding, top_k, filters,
+                           {"context": context, "response": "".join(pieces)}, generation)
+
+        return context, caching()
+
+    def query_batch(self, queries, top_k=3, filters: dict = None):
+        queries = list(queries)
+        q_embeddings = self.embedder.embed_queries(queries)
+        results = [self.cache.get(q, e, top_k, filters) if self.cache else None for q, e in zip(queries, q_embeddings)]
+        misses = [i for i, result in enumerate(results) if not result]
+        if not misses:
+            return results
+        generation = self.cache.generation if self.cache else None
+        with self.index_lock.read():
+            context_chunks = self.vectordb.query_batch([q_embeddings[i] for i in misses], top_k, filters=filters)
+        contexts = [self.packer.pack(queries[i], chunks) for i, chunks in zip(misses, context_chunks)]
+        responses = self.llm.generate_batch(contexts, [queries[i] for i in misses])
+        for i, context, response in zip(misses, contexts, responses):
+            results[i] = {"context": context, "response": response}
+            if self.cache:
+                self.cache.put(queries[i], q_embeddings[i], top_k, filters, results[i], generation)
+        return results
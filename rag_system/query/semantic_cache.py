@@ -0,0 +1,91 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+import faiss
+import numpy as np
+
+# figures, years, quarters and months: "Q1 2024" and "Q1 2025" embed almost identically but differ
+NUMERIC_TOKENS = re.compile(r"\d+(?:[.,]\d+)*|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\b")
+
+class SemanticCache:
+    """Answers recent questions again when a new query embedding is within `threshold` cosine similarity.
+
+    Query embeddings live in a small inner-product FAISS index over normalized vectors. Entries expire
+    after `ttl` seconds and the least recently used ones are dropped beyond `max_entries`. A hit also
+    requires the same top_k and filters, so a narrower query never gets a broader answer, and the same
+    numbers and month names in the query text, so a question about another period or figure misses.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1024, ttl: float = 3600.0, candidates: int = 8):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.candidates = candidates
+        self.lock = threading.Lock()
+        self.index = None
+        self.entries = OrderedDict()  # id -> (expires_at, scope, value), least recently used first
+        self.next_id = 0
+        # bumped on invalidation, so answers computed against the old index are not stored
+        self.generation = 0
+
+    def get(self, query, embedding, top_k, filters=None):
+        vector = self._normalize(embedding)
+        scope = self._scope(query, top_k, filters)
+        with self.lock:
+            self._expire()
+            if self.index is None or self.index.ntotal == 0:
+                return None
+            scores, ids = self.index.search(vector, min(self.candidates, self.index.ntotal))
+            for score, i in zip(scores[0], ids[0]):
+                if score < self.threshold:
+                    break
+                entry = self.entries.get(int(i))
+                if entry and entry[1] == scope:
+                    self.entries.move_to_end(int(i))
+                    return entry[2]
+        return None
+
+    def put(self, query, embedding, top_k, filters, value, generation):
+        vector = self._normalize(embedding)
+        with self.lock:
+            if generation != self.generation:
+                return
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+            i = self.next_id
+            self.next_id += 1
+            self.index.add_with_ids(vector, np.array([i], dtype='int64'))
+            self.entries[i] = (time.monotonic() + self.ttl, self._scope(query, top_k, filters), value)
+            evicted = []
+            while len(self.entries) > self.max_entries:
+                evicted.append(self.entries.popitem(last=False)[0])
+            if evicted:
+                self.index.remove_ids(np.array(evicted, dtype='int64'))
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.index = None
+
+    def _expire(self):
+        now = time.monotonic()
+        # entries are in use order, not expiry order, so scan them all
+        expired = [i for i, (expires_at, _, _) in self.entries.items() if expires_at <= now]
+        for i in expired:
+            del self.entries[i]
+        if expired:
+            self.index.remove_ids(np.array(expired, dtype='int64'))
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.array([embedding], dtype='float32')
+        faiss.normalize_L2(vector)
+        return vector
+
+    @staticmethod
+    def _scope(query, top_k, filters):
+        numbers = tuple(sorted(set(NUMERIC_TOKENS.findall(query.lower()))))
+        return top_k, json.dumps(filters, sort_keys=True) if filters else None, numbers
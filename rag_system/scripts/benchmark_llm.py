@@ -0,0 +1,51 @@
+"""Compare generation latency of the PyTorch and ONNX Runtime FlanT5 backends on CPU.
+
+    cd rag_system && python -m scripts.benchmark_llm --doc-path ./documents --runs 10
+
+The ONNX artifacts are exported into (or reused from) the blobstore at --doc-path.
+"""
+import argparse
+import statistics
+import time
+from blobstore.local_blobstore import LocalBlobStore
+from llm.flan_t5 import FlanT5
+from llm.flan_t5_onnx import FlanT5Onnx
+
+CONTEXT = (
+    "Total revenues grew 25% year-over-year to $25.2 billion, driven by higher Model Y deliveries. "
+    "Operating income was $2.7 billion, and free cash flow reached $0.9 billion for the quarter."
+)
+QUERIES = [
+    "What were total revenues?",
+    "Why did revenue increase?",
+    "What was operating income?",
+    "How much free cash flow was generated?",
+]
+
+def measure(llm, runs):
+    llm.generate(CONTEXT, QUERIES[0])  # warm-up
+    latencies = []
+    for i in range(runs):
+        start = time.perf_counter()
+        llm.generate(CONTEXT, QUERIES[i % len(QUERIES)])
+        latencies.append(time.perf_counter() - start)
+    return statistics.mean(latencies), statistics.median(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--doc-path", default="./documents")
+    parser.add_argument("--model", default="google/flan-t5-large")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    results = {}
+    results["pytorch fp32"] = measure(FlanT5(args.model), args.runs)
+    results["onnx int8"] = measure(FlanT5Onnx(LocalBlobStore(args.doc_path), model_name=args.model), args.runs)
+
+    baseline = results["pytorch fp32"][0]
+    for name, (mean, median) in results.items():
+        print(f"{name:>14}: mean {mean * 1000:7.1f} ms  median {median * 1000:7.1f} ms  "
+              f"speedup {baseline / mean:4.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modules import each other from the rag_system root, as the apps run them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
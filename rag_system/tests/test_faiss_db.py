@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from blobstore.local_blobstore import LocalBlobStore
+from vectordb.faiss_db import FAISSVectorDB, INDEX_TYPES, ROTATIONS
+
+@pytest.fixture(scope="module")
+def corpus():
+    vectors = np.random.default_rng(0).standard_normal((2000, 32)).astype("float32")
+    documents = [{"text": f"t{i}", "source": f"f{i % 5}.txt"} for i in range(len(vectors))]
+    return vectors, documents
+
+@pytest.mark.parametrize("rotation", ROTATIONS)
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_search_after_remove(tmp_path, corpus, index_type, rotation):
+    vectors, documents = corpus
+    db = FAISSVectorDB(LocalBlobStore(str(tmp_path / "store")), cache_dir=str(tmp_path / "cache"))
+    db.build_index(vectors, documents, index_type=index_type, rotation=rotation, nlist=16, nprobe=16,
+                   pq_m=8, pq_nbits=6, pca_dim=32 if rotation == "pca" else None)
+
+    db.remove([0, 1, 2, 7])
+    assert [db.search(vectors[i], 1)[0][1] for i in (100, 500, 1999)] == [100, 500, 1999]
+    hits = [i for _, i, _ in db.search(vectors[101], 3, filters={"sources": ["f1.txt"]})]
+    assert hits[0] == 101 and all(i % 5 == 1 for i in hits)
+
+    ids = db.add(vectors[:1], documents[:1])
+    assert db.search(vectors[0], 1)[0][1] == ids[0]
+    db.compact()
+    assert db.search(vectors[500], 1)[0][1] == 500
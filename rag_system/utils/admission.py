@@ -0,0 +1,80 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .forksafe import after_fork
+
+class Overloaded(Exception):
+    """Raised when a request is rejected at admission; `retry_after` is a hint in seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server busy, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Runs blocking work on a bounded pool so the event loop stays free.
+
+    At most `max_concurrent` calls run at once and `max_queue` more may wait; anything beyond that is
+    rejected with Overloaded right away, so queueing delay stays bounded instead of growing until
+    clients time out. Retry-After is estimated from the recent average service time.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 16):
+        self.max_concurrent = max_concurrent
+        self.capacity = max_concurrent + max_queue
+        self.avg_seconds = 1.0  # moving average of how long admitted calls take
+        self._reset()
+        after_fork(self._reset)
+
+    def _reset(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="admitted")
+        self.lock = threading.Lock()
+        self.admitted = 0
+
+    async def run(self, fn, *args):
+        release = self._admit()
+        future = self.executor.submit(fn, *args)
+        # released when the work really ends, even if the awaiting request went away
+        future.add_done_callback(lambda f: release())
+        return await asyncio.wrap_future(future)
+
+    async def run_held(self, fn, *args):
+        """Like run, but return (result, release): the slot stays taken until release() is called.
+
+        For calls whose work goes on after they return, such as a token stream that is generated
+        while it is read; release() may be called more than once.
+        """
+        release = self._admit()
+        future = self.executor.submit(fn, *args)
+        try:
+            return await asyncio.wrap_future(future), release
+        except BaseException:
+            # nobody gets the result to release the slot with
+            future.add_done_callback(lambda f: release())
+            raise
+
+    def stats(self):
+        with self.lock:
+            return {"admitted": self.admitted, "capacity": self.capacity, "avg_seconds": self.avg_seconds}
+
+    def _admit(self):
+        with self.lock:
+            if self.admitted >= self.capacity:
+                raise Overloaded(self._retry_after())
+            self.admitted += 1
+        start, released = time.monotonic(), []
+
+        def release():
+            with self.lock:
+                if released:
+                    return
+                released.append(True)
+                self.admitted -= 1
+                self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * (time.monotonic() - start)
+
+        return release
+
+    def _retry_after(self):
+        # time for the pool to work through what is already admitted
+        return max(1, math.ceil(self.avg_seconds * self.admitted / self.max_concurrent))
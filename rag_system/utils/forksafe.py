@@ -0,0 +1,17 @@
+import os
+import weakref
+
+def after_fork(method):
+    """Call the bound `method` in every forked child, for as long as its object is still alive.
+
+    Threads, pools and SQLite connections don't survive os.fork; objects owning them use this to
+    recreate them in pre-forked workers.
+    """
+    ref = weakref.WeakMethod(method)
+
+    def hook():
+        bound = ref()
+        if bound is not None:
+            bound()
+
+    os.register_at_fork(after_in_child=hook)
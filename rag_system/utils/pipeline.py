@@ -0,0 +1,75 @@
+import queue
+import threading
+
+_END = object()
+
+class Cancelled(Exception):
+    """Raised in a producer once the consumer has closed its Channel."""
+
+class Channel:
+    """A bounded queue joining two pipeline stages that run in different threads.
+
+    The producer calls `put` for each item and `finish` at the end; `put` blocks while the channel is
+    full, which keeps a fast stage from running ahead of a slow one. The consumer iterates it, and gets
+    the producer's error re-raised. A consumer that stops early calls `close`, after which the producer's
+    next `put` raises Cancelled instead of blocking forever.
+    """
+
+    def __init__(self, maxsize: int):
+        self.queue = queue.Queue(maxsize)
+        self.closed = threading.Event()
+
+    def put(self, item):
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise Cancelled()
+
+    def finish(self, error: BaseException = None):
+        try:
+            self.put((_END, error))
+        except Cancelled:
+            pass
+
+    def close(self):
+        self.closed.set()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed.is_set():
+            raise StopIteration
+        item = self.queue.get()
+        if isinstance(item, tuple) and len(item) == 2 and item[0] is _END:
+            self.close()
+            if item[1] is not None:
+                raise item[1]
+            raise StopIteration
+        return item
+
+def prefetch(iterable, maxsize: int, name: str = "prefetch") -> Channel:
+    """Iterate `iterable` in a daemon thread, at most `maxsize` items ahead of the caller."""
+    channel = Channel(maxsize)
+
+    def produce():
+        try:
+            for item in iterable:
+                channel.put(item)
+        except Cancelled:
+            pass
+        except BaseException as e:
+            channel.finish(e)
+        else:
+            channel.finish()
+        finally:
+            # lets a generator upstream release its own pools and channels
+            close = getattr(iterable, "close", None)
+            if close:
+                close()
+
+    threading.Thread(target=produce, name=name, daemon=True).start()
+    return channel
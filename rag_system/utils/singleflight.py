@@ -0,0 +1,54 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key wait for and share its outcome."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> Future of the in-flight call
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            # re-raises the leader's exception as well
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            # later arrivals start a fresh call instead of reusing a finished one
+            with self._lock:
+                del self._calls[key]
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        """Like `do` for a coroutine function; waiting callers don't hold a thread."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            # shielded so a caller that goes away doesn't cancel the shared call
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
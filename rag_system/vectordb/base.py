@@ -1,12 +1,32 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional
 
 class VectorDB(ABC):
     @abstractmethod
     def build_index(self, embeddings: List[List[float]], documents: List[str]): pass
 
+    def build_index_stream(self, batches, **index_options):
+        """Build from (embeddings, documents, ids) batches; this fallback collects them and calls build_index."""
+        embeddings, documents = [], []
+        for batch_embeddings, batch_documents, _ in batches:
+            embeddings.extend(batch_embeddings)
+            documents.extend(batch_documents)
+        self.build_index(embeddings, documents, **index_options)
+
+    @abstractmethod
+    def add(self, embeddings: List[List[float]], documents: List[dict]) -> List[int]: pass
+
+    @abstractmethod
+    def remove(self, ids: List[int]): pass
+
+    @abstractmethod
+    def get_documents(self, ids: List[int]) -> List[Optional[dict]]: pass
+
     @abstractmethod
-    def query(self, embedding: List[float], k: int) -> List[str]: pass
+    def query(self, embedding: List[float], k: int, filters: dict = None) -> List[str]: pass
+
+    def query_batch(self, embeddings: List[List[float]], k: int, filters: dict = None) -> List[List[str]]:
+        return [self.query(embedding, k, filters=filters) for embedding in embeddings]
 
     @abstractmethod
     def load(self): pass
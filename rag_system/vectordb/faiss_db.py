@@ -1,48 +1,437 @@
 import faiss
+import itertools
+import json
 import pickle
 import os
 import tempfile
 import numpy as np
+from docstore.sqlite_docstore import SQLiteDocStore
+from utils.rwlock import RWLock
 from .base import VectorDB
 
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "sq8", "sq_fp16", "pq", "ivf_sq8", "ivf_pq")
+ROTATIONS = (None, "opq", "pca")
+# vectors held back as the training sample when a trained codec is built from a stream
+STREAM_SAMPLE = 32768
+# resident bytes per entry of IndexIDMap2's id -> position hash map, which is not serialized
+REV_MAP_BYTES = 40
+
 class FAISSVectorDB(VectorDB):
-    def __init__(self, blobstore, index_path="vector_index/index.bin"):
+    def __init__(self, blobstore, index_path="vector_index/index.bin", mmap=False,
+                 cache_dir="~/.cache/rag_system"):
         self.blobstore = blobstore
         self.index_path = index_path
+        # mmap mode maps IVF lists from a persistent local copy instead of reading them;
+        # cache_dir also holds the local docstore
+        self.mmap = mmap
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.read_only = False
         self.index = None
-        self.docs = []
-
-    def build_index(self, embeddings, documents):
-        # called from orchestrator to build index
-        dim = len(embeddings[0])
-        self.index = faiss.IndexFlatL2(dim)
-        self.index.add(np.array(embeddings).astype('float32'))
-        self.docs = documents
+        # FAISS id -> {"text", "source"}, read from disk k rows at a time
+        self.docstore = None
+        # index type + search-time knobs, persisted next to the index
+        self.params = {"index_type": "flat"}
+        # searches share the index, add/remove/compact/load replace parts of it
+        self.lock = RWLock()
+        self._tombstone_selector = None
+
+    def build_index(self, embeddings, documents, ids=None, **index_options):
+        # called from orchestrator to build index; ids default to 0..n-1
+        vectors = np.array(embeddings).astype('float32')
+        ids = np.arange(len(vectors), dtype='int64') if ids is None else np.array(ids, dtype='int64')
+        self.build_index_stream([(vectors, documents, ids)], **index_options)
+
+    def build_index_stream(self, batches, index_type="flat", nlist=None,
+                           hnsw_m=32, nprobe=8, ef_search=64, train_size=None,
+                           pq_m=None, pq_nbits=8, rotation=None, pca_dim=None):
+        """Build from an iterable of (embeddings, documents, ids) batches, adding each one as it arrives.
+
+        Documents go straight to the docstore. Codecs that need training first hold up to `train_size`
+        vectors (STREAM_SAMPLE by default) as the training sample, so with IVF on a corpus much larger
+        than that, pass `nlist` rather than relying on the default derived from the sample.
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+        if rotation not in ROTATIONS:
+            raise ValueError(f"Unknown rotation '{rotation}', expected one of {ROTATIONS}")
+        self._reset_docstore()
+
+        batches = iter(batches)
+        trained = index_type in ("flat", "hnsw", "sq_fp16") and rotation is None
+        sample_size = 0 if trained else train_size or STREAM_SAMPLE
+        sample, sample_ids = [], []
+        for vectors, documents, ids in batches:
+            sample.append(np.array(vectors).astype('float32'))
+            sample_ids.append(np.array(ids, dtype='int64'))
+            self.docstore.put_many(sample_ids[-1].tolist(), documents)
+            if sum(len(v) for v in sample) >= sample_size:
+                break
+        if not sample:
+            raise ValueError("No embeddings to build the index from")
+        vectors, ids = np.concatenate(sample), np.concatenate(sample_ids)
+        del sample, sample_ids
+        dim = vectors.shape[1]
+
+        if index_type.startswith("ivf"):
+            nlist = nlist or self._default_nlist(len(vectors))
+        code_dim = (pca_dim or dim) if rotation == "pca" else dim
+        pq_m = pq_m or max(1, code_dim // 4)
+        factory = self._factory_string(index_type, nlist, hnsw_m, pq_m, pq_nbits, rotation, code_dim)
+        self.index = self._new_index(dim, index_type, factory)
+
+        if not self.index.is_trained and len(vectors):
+            # IVF needs ~39+ points per list, PQ/OPQ ~39+ per codebook centroid
+            default_size = max(64 * (nlist or 0), 39 * 2 ** pq_nbits if "PQ" in factory else 0, 10000)
+            self.index.train(self._training_sample(vectors, train_size or default_size))
+        next_id = 0
+        # the sample first, then every remaining batch as it comes off the stream
+        for vectors, documents, ids in itertools.chain([(vectors, None, ids)], batches):
+            vectors, ids = np.array(vectors).astype('float32'), np.array(ids, dtype='int64')
+            if len(vectors):
+                self.index.add_with_ids(vectors, ids)
+                next_id = max(next_id, int(ids.max()) + 1)
+            if documents is not None:
+                self.docstore.put_many(ids.tolist(), documents)
+        self.read_only = False
+        self._tombstone_selector = None
+
+        self.params = {"index_type": index_type, "factory": factory, "nprobe": nprobe,
+                       "efSearch": ef_search, "next_id": next_id}
         self._save()
+        footprint = self.memory_footprint()
+        print(f"📦 Built {factory} index: {footprint['vectors']} vectors, "
+              f"{footprint['index_bytes'] / 2**20:.1f} MiB ({footprint['compression_ratio']:.1f}x vs float32)")
+
+    @staticmethod
+    def _new_index(dim, index_type, factory):
+        # stable ids let incremental re-indexing add/remove one file's chunks in place. IVF lists store
+        # the ids themselves; the other codecs are positional and take an IDMap. Never IDMap2 over IVF:
+        # its id_map is compacted on removal while the lists keep their old labels
+        if index_type.startswith("ivf"):
+            return faiss.index_factory(dim, factory)
+        return faiss.index_factory(dim, "IDMap," + factory)
+
+    @staticmethod
+    def _factory_string(index_type, nlist, hnsw_m, pq_m, pq_nbits, rotation, code_dim):
+        codecs = {
+            "flat": "Flat",
+            "ivf_flat": f"IVF{nlist},Flat",
+            "hnsw": f"HNSW{hnsw_m},Flat",
+            "sq8": "SQ8",
+            "sq_fp16": "SQfp16",
+            "pq": f"PQ{pq_m}x{pq_nbits}",
+            "ivf_sq8": f"IVF{nlist},SQ8",
+            "ivf_pq": f"IVF{nlist},PQ{pq_m}x{pq_nbits}",
+        }
+        factory = codecs[index_type]
+        if rotation == "opq":
+            factory = f"OPQ{pq_m}_{code_dim}," + factory
+        elif rotation == "pca":
+            factory = f"PCA{code_dim}," + factory
+        return factory
+
+    def memory_footprint(self):
+        # index_bytes is the serialized size recorded at save/load time. The IDMap and IVF indexes built
+        # here hold the same in memory; an IDMap2 (indexes built before) also keeps a reverse map
+        n, dim = self.index.ntotal, self.index.d
+        index_bytes = self.params.get("index_bytes", n * dim * 4)
+        if isinstance(self.index, faiss.IndexIDMap2):
+            index_bytes += n * REV_MAP_BYTES
+        return {
+            "vectors": n,
+            "index_bytes": index_bytes,
+            "float32_bytes": n * dim * 4,
+            "compression_ratio": (n * dim * 4) / index_bytes if index_bytes else 1.0,
+        }
+
+    def add(self, embeddings, documents, ids=None):
+        # append chunks under fresh (or caller-assigned) ids and return them
+        vectors = np.array(embeddings).astype('float32')
+        with self.lock.write():
+            start = self.params["next_id"]
+            ids = np.arange(start, start + len(vectors), dtype='int64') if ids is None else np.array(ids, dtype='int64')
+            if len(vectors):
+                self.index.add_with_ids(vectors, ids)
+                self.params["next_id"] = max(start, int(ids.max()) + 1)
+            self._mark_docstore_dirty()
+            self.docstore.put_many(ids.tolist(), documents)
+        return ids.tolist()
+
+    def share_codec(self, other):
+        """Empty this index and take over `other`'s trained codec, e.g. for a shard built without vectors."""
+        index = faiss.clone_index(other.index)
+        index.reset()  # drops the vectors and ids, keeps the trained quantizers
+        with self.lock.write():
+            self.index = index
+            self.params = {**{key: other.params[key] for key in ("index_type", "factory", "nprobe", "efSearch")},
+                           "next_id": self.params.get("next_id", 0)}
+            self._tombstone_selector = None
+            self._save()
+
+    def ensure_writable(self):
+        # mmapped inverted lists are read-only; mutations need the index on the heap
+        if self.read_only:
+            self.load(mmap=False)
+
+    def remove(self, ids):
+        if not ids:
+            return
+        with self.lock.write():
+            if self.params.get("index_type") == "hnsw":
+                # HNSW graphs cannot drop vectors in place: hide them until the next compact()
+                present = [i for i, doc in zip(ids, self.docstore.get_many(ids)) if doc]
+                self.params["tombstones"] = sorted(set(self.params.get("tombstones", [])) | set(present))
+                self._tombstone_selector = None
+            else:
+                self.index.remove_ids(np.array(ids, dtype='int64'))
+            self._mark_docstore_dirty()
+            self.docstore.delete_many(ids)
+
+    def get_documents(self, ids):
+        with self.lock.read():
+            return self.docstore.get_many(ids)
+
+    def tombstone_ratio(self):
+        return len(self.params.get("tombstones", [])) / max(1, self.index.ntotal)
+
+    def compact(self):
+        # rebuild the HNSW graph without its tombstoned vectors
+        tombstones = self.params.get("tombstones")
+        if not tombstones:
+            return
+        with self.lock.read():
+            ids = faiss.vector_to_array(self.index.id_map)
+            keep = ~np.isin(ids, tombstones)
+            vectors = self.index.index.reconstruct_n(0, self.index.ntotal)[keep]
+            # a copy of the trained index, not a fresh one: OPQ/PCA rotations would come back untrained
+            index = faiss.clone_index(self.index)
+            index.reset()
+            index.add_with_ids(vectors, ids[keep])
+        with self.lock.write():
+            self.index = index
+            self.params["tombstones"] = []
+            self._tombstone_selector = None
+
+    def save(self):
+        with self.lock.read():
+            self._save()
+
+    def close(self):
+        with self.lock.write():
+            if self.docstore:
+                self.docstore.close()
+            self.index = None
+            self.docstore = None
 
-    def query(self, embedding, k):
-        D, I = self.index.search(np.array([embedding]).astype('float32'), k)
-        return [self.docs[i]["text"] for i in I[0]]
+    def query(self, embedding, k, nprobe=None, ef_search=None, filters=None):
+        return [doc["text"] for _, _, doc in self.search(embedding, k, nprobe, ef_search, filters)]
+
+    def search(self, embedding, k, nprobe=None, ef_search=None, filters=None):
+        # returns (distance, id, doc) triples, nearest first
+        return self.search_batch([embedding], k, nprobe, ef_search, filters)[0]
+
+    def query_batch(self, embeddings, k, nprobe=None, ef_search=None, filters=None):
+        return [[doc["text"] for _, _, doc in hits]
+                for hits in self.search_batch(embeddings, k, nprobe, ef_search, filters)]
+
+    def search_batch(self, embeddings, k, nprobe=None, ef_search=None, filters=None):
+        # one matrix search and one docstore read for the whole batch
+        with self.lock.read():
+            queries = np.array(embeddings).astype('float32')
+            ids = None
+            if filters:
+                # resolve the metadata filter to ids first so FAISS only scores matching vectors
+                ids = self.docstore.ids_matching(**filters)
+                if not ids:
+                    return [[] for _ in embeddings]
+            if ids is not None and self.params.get("index_type") == "pq":
+                hits = self._search_post_filtered(queries, k, ids)
+            else:
+                selector = self._id_selector(ids) if ids is not None else None
+                params = self._search_parameters(nprobe, ef_search, selector)
+                D, I = self.index.search(queries, k, params=params)
+                hits = [[(float(d), int(i)) for d, i in zip(row_d, row_i) if i >= 0] for row_d, row_i in zip(D, I)]
+            unique_ids = list({i for row in hits for _, i in row})
+            docs = dict(zip(unique_ids, self.docstore.get_many(unique_ids)))
+        return [[(d, i, docs[i]) for d, i in row if docs[i]] for row in hits]
+
+    def _search_post_filtered(self, queries, k, ids):
+        # IndexPQ takes no ID selector: oversample by the filter's selectivity, keep the matching ids,
+        # and widen the search until every query has its k matches or the whole index was scanned
+        allowed = np.array(ids, dtype='int64')
+        ntotal = self.index.ntotal
+        wanted = min(k, len(allowed))
+        fetch = min(ntotal, max(4 * k, k * ntotal // len(allowed)))
+        while True:
+            D, I = self.index.search(queries, fetch)
+            matches = np.isin(I, allowed)
+            hits = [[(float(d), int(i)) for d, i, m in zip(row_d, row_i, row_m) if m][:k]
+                    for row_d, row_i, row_m in zip(D, I, matches)]
+            if fetch >= ntotal or all(len(row) >= wanted for row in hits):
+                return hits
+            fetch = min(ntotal, 4 * fetch)
+
+    def _id_selector(self, ids):
+        ids = np.array(ids, dtype='int64')
+        id_space = self.params["next_id"]
+        if len(ids) * 64 < id_space:
+            return faiss.IDSelectorBatch(ids)
+        # dense matches: one bit per id beats hashing every candidate
+        bits = np.zeros(id_space, dtype=bool)
+        bits[ids] = True
+        bitmap = np.packbits(bits, bitorder='little')
+        selector = faiss.IDSelectorBitmap(id_space, faiss.swig_ptr(bitmap))
+        selector.referenced_objects = [bitmap]
+        return selector
+
+    def _search_parameters(self, nprobe=None, ef_search=None, selector=None):
+        # per-call overrides fall back to the knobs saved with the index
+        index_type = self.params.get("index_type", "flat")
+        tombstones = self._tombstones()
+        if selector is not None and tombstones is not None:
+            combined = faiss.IDSelectorAnd(selector, tombstones)
+            combined.referenced_objects = [selector, tombstones]
+            selector = combined
+        elif selector is None:
+            selector = tombstones
+
+        if index_type.startswith("ivf"):
+            params = faiss.SearchParametersIVF(nprobe=nprobe or self.params["nprobe"])
+        elif index_type == "hnsw":
+            params = faiss.SearchParametersHNSW(efSearch=ef_search or self.params["efSearch"])
+        elif selector is not None:
+            params = faiss.SearchParameters()
+        else:
+            return None
+        if selector is not None:
+            params.sel = selector
+            # FAISS does not own the selector; keep it alive as long as the params
+            params.referenced_objects = [selector]
+        return params
+
+    def _tombstones(self):
+        # the selector must outlive the search call, so it is cached until tombstones change
+        tombstones = self.params.get("tombstones")
+        if not tombstones:
+            return None
+        if self._tombstone_selector is None:
+            batch = faiss.IDSelectorBatch(np.array(tombstones, dtype='int64'))
+            self._tombstone_selector = (faiss.IDSelectorNot(batch), batch)
+        return self._tombstone_selector[0]
+
+    @staticmethod
+    def _default_nlist(n):
+        # ~4*sqrt(n) lists, while keeping at least 39 training points per centroid
+        return max(1, min(int(4 * np.sqrt(n)), n // 39))
+
+    @staticmethod
+    def _training_sample(vectors, size):
+        if len(vectors) <= size:
+            return vectors
+        rng = np.random.default_rng(1234)
+        return vectors[rng.choice(len(vectors), size, replace=False)]
+
+    def _cached_copy(self, remote_path):
+        # reuse the local copy while the remote checksum is unchanged
+        local_fp = os.path.join(self.cache_dir, remote_path)
+        checksum_fp = local_fp + ".checksum"
+        remote_checksum = self.blobstore.checksum(remote_path)
+        if os.path.exists(local_fp) and os.path.exists(checksum_fp):
+            with open(checksum_fp) as f:
+                if f.read() == remote_checksum:
+                    return local_fp
+
+        # download next to the target and swap it in, so processes still mapping the
+        # previous file keep a valid inode
+        os.makedirs(os.path.dirname(local_fp), exist_ok=True)
+        fd, tmp_fp = tempfile.mkstemp(dir=os.path.dirname(local_fp))
+        os.close(fd)
+        self.blobstore.download_file(remote_path, tmp_fp)
+        os.replace(tmp_fp, local_fp)
+        with open(checksum_fp, "w") as f:
+            f.write(remote_checksum)
+        return local_fp
+
+    def _docstore_path(self):
+        return os.path.join(self.cache_dir, self._artifact_path(".docs.db"))
+
+    def _open_docstore(self, path):
+        if self.docstore:
+            self.docstore.close()
+        self.docstore = SQLiteDocStore(path)
+
+    def _reset_docstore(self):
+        local_fp = self._docstore_path()
+        if self.docstore:
+            self.docstore.close()
+            self.docstore = None
+        for fp in (local_fp, local_fp + ".checksum"):
+            if os.path.exists(fp):
+                os.remove(fp)
+        self._open_docstore(local_fp)
+
+    def _mark_docstore_dirty(self):
+        # the local copy now differs from the blobstore until the next save
+        checksum_fp = self._docstore_path() + ".checksum"
+        if os.path.exists(checksum_fp):
+            os.remove(checksum_fp)
+
+    def _artifact_path(self, ext):
+        return os.path.splitext(self.index_path)[0] + ext
 
     def _save(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             index_fp = os.path.join(tmpdir, "index.bin")
-            meta_fp = os.path.join(tmpdir, "docs.pkl")
+            params_fp = os.path.join(tmpdir, "index.json")
             faiss.write_index(self.index, index_fp)
-            with open(meta_fp, "wb") as f:
-                pickle.dump(self.docs, f)
+            self.params["index_bytes"] = os.path.getsize(index_fp)
+            with open(params_fp, "w") as f:
+                json.dump(self.params, f)
+            self.docstore.commit()
             self.blobstore.upload_file(index_fp, self.index_path)
-            self.blobstore.upload_file(meta_fp, self.index_path.replace(".bin", ".pkl"))
+            self.blobstore.upload_file(self.docstore.path, self._artifact_path(".docs.db"))
+            self.blobstore.upload_file(params_fp, self._artifact_path(".json"))
+        with open(self._docstore_path() + ".checksum", "w") as f:
+            f.write(self.blobstore.checksum(self._artifact_path(".docs.db")))
 
-    def load(self):
+    def load(self, mmap=None):
         if not self.blobstore.exists(self.index_path):
             return False
-        with tempfile.TemporaryDirectory() as tmpdir:
+        mmap = self.mmap if mmap is None else mmap
+        with self.lock.write(), tempfile.TemporaryDirectory() as tmpdir:
             index_fp = os.path.join(tmpdir, "index.bin")
-            meta_fp = os.path.join(tmpdir, "docs.pkl")
-            self.blobstore.download_file(self.index_path, index_fp)
-            self.blobstore.download_file(self.index_path.replace(".bin", ".pkl"), meta_fp)
-            self.index = faiss.read_index(index_fp)
-            with open(meta_fp, "rb") as f:
-                self.docs = pickle.load(f)
+            params_fp = os.path.join(tmpdir, "index.json")
+            if mmap:
+                # IO_FLAG_MMAP maps IVF inverted lists (the bulk of an IVF index) straight from the
+                # file, so they live in the shared page cache; other index types are still read
+                index_fp = self._cached_copy(self.index_path)
+                self.index = faiss.read_index(index_fp, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            else:
+                self.blobstore.download_file(self.index_path, index_fp)
+                self.index = faiss.read_index(index_fp)
+            self.read_only = mmap
+            if self.blobstore.exists(self._artifact_path(".docs.db")):
+                self._open_docstore(self._cached_copy(self._artifact_path(".docs.db")))
+            else:
+                self._migrate_pickled_docs(os.path.join(tmpdir, "docs.pkl"))
+            # indexes saved before search params were persisted are plain flat indexes
+            if self.blobstore.exists(self._artifact_path(".json")):
+                self.blobstore.download_file(self._artifact_path(".json"), params_fp)
+                with open(params_fp) as f:
+                    self.params = json.load(f)
+            self.params.setdefault("next_id", self.index.ntotal)
+            self._tombstone_selector = None
+            self.params["index_bytes"] = os.path.getsize(index_fp)
         return True
+
+    def _migrate_pickled_docs(self, meta_fp):
+        # indexes saved before the docstore kept every chunk in docs.pkl
+        self.blobstore.download_file(self._artifact_path(".pkl"), meta_fp)
+        with open(meta_fp, "rb") as f:
+            docs = pickle.load(f)
+        # ...and before ids were stable, as a list indexed by row position
+        if isinstance(docs, list):
+            docs = dict(enumerate(docs))
+        self._reset_docstore()
+        self.docstore.put_many(list(docs), list(docs.values()))
+        self.docstore.commit()
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+
+class IndexManifest:
+    """Tracks which chunk ids each source file contributed to the index."""
+
+    def __init__(self, blobstore, path, files=None):
+        self.blobstore = blobstore
+        self.path = path
+        # file path -> {"checksum": str, "ids": [start, stop), "dedup": {...counts, "repeats": [paths]}}
+        self.files = files or {}
+        # duplicate-chunk savings over the files in the index, if it deduplicates
+        self.dedup = None
+
+    @classmethod
+    def for_index(cls, blobstore, index_path):
+        return cls(blobstore, os.path.splitext(index_path)[0] + ".manifest.json")
+
+    def load(self):
+        if not self.blobstore.exists(self.path):
+            return False
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, "manifest.json")
+            self.blobstore.download_file(self.path, fp)
+            with open(fp) as f:
+                data = json.load(f)
+        self.files = data["files"]
+        self.dedup = data.get("dedup")
+        return True
+
+    def save(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, "manifest.json")
+            with open(fp, "w") as f:
+                json.dump({"files": self.files, "dedup": self.dedup}, f)
+            self.blobstore.upload_file(fp, self.path)
+
+    def diff(self, checksums):
+        # returns (added, changed, removed) file paths against the current listing
+        added = [p for p in checksums if p not in self.files]
+        changed = [p for p in checksums if p in self.files and self.files[p]["checksum"] != checksums[p]]
+        removed = [p for p in self.files if p not in checksums]
+        return added, changed, removed
+
+    def ids_for(self, paths):
+        ids = []
+        for p in paths:
+            start, stop = self.files[p]["ids"]
+            ids.extend(range(start, stop))
+        return ids
+
+    def record(self, path, checksum, ids, dedup=None):
+        # chunks of one file are added together, so their ids are contiguous
+        start, stop = (ids[0], ids[-1] + 1) if ids else (0, 0)
+        self.files[path] = {"checksum": checksum, "ids": [start, stop]}
+        if dedup is not None:
+            # the file's dropped duplicates: how many, and which files hold the copies they repeat
+            self.files[path]["dedup"] = dedup
+
+    def dependents(self, paths):
+        """Files whose dropped duplicates repeat chunks of `paths`, directly or through one another."""
+        paths, found = set(paths), set()
+        frontier = paths
+        while frontier:
+            frontier = {p for p, entry in self.files.items() if p not in paths and p not in found
+                        and frontier.intersection(entry.get("dedup", {}).get("repeats", ()))}
+            found |= frontier
+        return sorted(found)
+
+    def dedup_totals(self):
+        # summed per-file counts, None if no file was deduplicated
+        entries = [entry["dedup"] for entry in self.files.values() if "dedup" in entry]
+        if not entries:
+            return None
+        return {key: sum(entry[key] for entry in entries) for key in entries[0] if key != "repeats"}
+
+    def drop(self, path):
+        self.files.pop(path, None)
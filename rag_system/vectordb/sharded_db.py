@@ -0,0 +1,218 @@
+import heapq
+import json
+import os
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .base import VectorDB
+from utils.forksafe import after_fork
+from utils.pipeline import Cancelled, Channel
+from .faiss_db import FAISSVectorDB
+
+class ShardedVectorDB(VectorDB):
+    """Splits the corpus over N FAISSVectorDB shards, each persisted separately, and fans searches out in parallel."""
+
+    def __init__(self, blobstore, index_path="vector_index/index.bin", num_shards=4, lazy=True,
+                 mmap=False, cache_dir="~/.cache/rag_system"):
+        self.blobstore = blobstore
+        self.index_path = index_path
+        self.num_shards = num_shards
+        # lazy shards are only downloaded and opened on first use
+        self.lazy = lazy
+        self.mmap = mmap
+        root, name = os.path.split(index_path)
+        self.shards = [
+            FAISSVectorDB(blobstore, os.path.join(root, f"shard_{i}", name), mmap=mmap, cache_dir=cache_dir)
+            for i in range(num_shards)
+        ]
+        self._loaded = [False] * num_shards
+        self._load_locks = [threading.Lock() for _ in range(num_shards)]
+        # FAISS releases the GIL during search, so shard searches overlap on the pool
+        self._start_pool()
+        after_fork(self._start_pool)
+        # index type and the global id counter, persisted next to the shards
+        self.params = {"index_type": "flat", "num_shards": num_shards, "next_id": 0}
+
+    def _start_pool(self):
+        self.pool = ThreadPoolExecutor(max_workers=self.num_shards, thread_name_prefix="shard-search")
+
+    def shard_of(self, source):
+        # all chunks of a file live in one shard, so per-file updates touch a single index
+        return zlib.crc32(source.encode("utf-8")) % self.num_shards
+
+    def build_index(self, embeddings, documents, **index_options):
+        vectors = np.array(embeddings).astype('float32')
+        self.build_index_stream([(vectors, documents, np.arange(len(vectors), dtype='int64'))], **index_options)
+
+    def build_index_stream(self, batches, **index_options):
+        """Route each (embeddings, documents, ids) batch to its shards, which all build concurrently."""
+        channels = [Channel(maxsize=2) for _ in range(self.num_shards)]
+        next_id = 0
+        with ThreadPoolExecutor(max_workers=self.num_shards, thread_name_prefix="shard-build") as pool:
+            builds = [pool.submit(self._build_shard, i, channels[i], index_options) for i in range(self.num_shards)]
+            try:
+                for embeddings, documents, ids in batches:
+                    vectors, ids = np.array(embeddings).astype('float32'), np.array(ids, dtype='int64')
+                    assignment = np.array([self.shard_of(d["source"]) for d in documents], dtype='int64')
+                    # every shard gets every batch, possibly empty, so each knows the dimension
+                    for i, channel in enumerate(channels):
+                        mask = assignment == i
+                        channel.put((vectors[mask], [d for d, m in zip(documents, mask) if m], ids[mask]))
+                    if len(ids):
+                        next_id = max(next_id, int(ids.max()) + 1)
+            except BaseException as e:
+                for channel in channels:
+                    channel.finish(Cancelled())
+                # a closed channel means a shard failed; its own error is raised below
+                if not isinstance(e, Cancelled):
+                    raise
+            else:
+                for channel in channels:
+                    channel.finish()
+            # the other shards were aborted with Cancelled, report the error that caused it
+            errors = sorted((b.exception() for b in builds if b.exception()), key=lambda e: isinstance(e, Cancelled))
+            if errors:
+                raise errors[0]
+        self._loaded = [True] * self.num_shards
+        for i in range(self.num_shards):
+            self._ensure_trained(i)
+        self.params = {"index_type": index_options.get("index_type", "flat"),
+                       "num_shards": self.num_shards, "next_id": next_id}
+        self._save_params()
+
+    def _build_shard(self, i, channel, index_options):
+        try:
+            self.shards[i].build_index_stream(channel, **index_options)
+        finally:
+            # a failed shard stops taking batches instead of blocking the router
+            channel.close()
+
+    def add(self, embeddings, documents):
+        vectors = np.array(embeddings).astype('float32')
+        start = self.params["next_id"]
+        ids = np.arange(start, start + len(vectors), dtype='int64')
+        self.params["next_id"] = start + len(vectors)
+        assignment = np.array([self.shard_of(d["source"]) for d in documents], dtype='int64')
+        for i in np.unique(assignment):
+            mask = assignment == i
+            self._ensure_trained(i)
+            self._shard(i).add(vectors[mask], [d for d, m in zip(documents, mask) if m], ids=ids[mask])
+        return ids.tolist()
+
+    def remove(self, ids):
+        # each shard only drops the ids it actually holds
+        if ids:
+            list(self.pool.map(lambda i: self._shard(i).remove(ids), range(self.num_shards)))
+
+    def get_documents(self, ids):
+        # ids don't tell their shard; each shard has None for the ones it doesn't hold
+        found = self.pool.map(lambda i: self._shard(i).get_documents(ids), range(self.num_shards))
+        return [next((doc for doc in docs if doc), None) for docs in zip(*found)]
+
+    def query(self, embedding, k, nprobe=None, ef_search=None, filters=None):
+        return [doc["text"] for _, _, doc in self.search(embedding, k, nprobe, ef_search, filters)]
+
+    def search(self, embedding, k, nprobe=None, ef_search=None, filters=None):
+        return self.search_batch([embedding], k, nprobe, ef_search, filters)[0]
+
+    def query_batch(self, embeddings, k, nprobe=None, ef_search=None, filters=None):
+        return [[doc["text"] for _, _, doc in hits]
+                for hits in self.search_batch(embeddings, k, nprobe, ef_search, filters)]
+
+    def search_batch(self, embeddings, k, nprobe=None, ef_search=None, filters=None):
+        shards = range(self.num_shards)
+        if filters and filters.get("sources"):
+            # sources are routed to shards by hash, so other shards cannot match
+            shards = sorted({self.shard_of(source) for source in filters["sources"]})
+        futures = [self.pool.submit(self._search_shard, i, embeddings, k, nprobe, ef_search, filters)
+                   for i in shards]
+        per_shard = [f.result() for f in futures]
+        # all shards share the L2 metric, so distances merge directly
+        return [heapq.nsmallest(k, (hit for hits in per_shard for hit in hits[q]), key=lambda hit: hit[0])
+                for q in range(len(embeddings))]
+
+    def _search_shard(self, i, embeddings, k, nprobe, ef_search, filters):
+        shard = self._shard(i)
+        if shard.index is None or shard.index.ntotal == 0:
+            return [[] for _ in embeddings]
+        return shard.search_batch(embeddings, k, nprobe, ef_search, filters)
+
+    def ensure_writable(self):
+        for i in range(self.num_shards):
+            self._shard(i).ensure_writable()
+
+    def tombstone_ratio(self):
+        return max(self._shard(i).tombstone_ratio() for i in range(self.num_shards))
+
+    def compact(self):
+        for i in range(self.num_shards):
+            self._shard(i).compact()
+
+    def memory_footprint(self):
+        # lazy shards that were never opened take no memory
+        footprints = [self.shards[i].memory_footprint() for i in range(self.num_shards) if self._loaded[i]]
+        total = {key: sum(f[key] for f in footprints) for key in ("vectors", "index_bytes", "float32_bytes")}
+        total["compression_ratio"] = total["float32_bytes"] / total["index_bytes"] if total["index_bytes"] else 1.0
+        total["shards"] = footprints
+        return total
+
+    def save(self):
+        for i in range(self.num_shards):
+            if self._loaded[i]:
+                self.shards[i].save()
+        self._save_params()
+
+    def close(self):
+        for i in range(self.num_shards):
+            if self._loaded[i]:
+                self.shards[i].close()
+        self._loaded = [False] * self.num_shards
+        self.pool.shutdown(wait=False)
+
+    def load(self, mmap=None):
+        if not self.blobstore.exists(self._params_path()):
+            return False
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, "shards.json")
+            self.blobstore.download_file(self._params_path(), fp)
+            with open(fp) as f:
+                self.params = json.load(f)
+        if self.params["num_shards"] != self.num_shards:
+            # ids are routed by source hash, so a different shard count means a rebuild
+            return False
+        self._loaded = [False] * self.num_shards
+        if not self.lazy:
+            list(self.pool.map(self._shard, range(self.num_shards)))
+        return True
+
+    def _ensure_trained(self, i):
+        # a shard that got no vectors at build time never trained its codec (IVF/PQ/SQ8); it takes
+        # one from a trained shard so it can accept adds
+        shard = self._shard(i)
+        if shard.index is None or shard.index.is_trained:
+            return
+        for j in range(self.num_shards):
+            other = self._shard(j)
+            if other.index is not None and other.index.is_trained and other.index.ntotal:
+                shard.share_codec(other)
+                return
+
+    def _shard(self, i):
+        if not self._loaded[i]:
+            with self._load_locks[i]:
+                if not self._loaded[i]:
+                    self.shards[i].load()
+                    self._loaded[i] = True
+        return self.shards[i]
+
+    def _params_path(self):
+        return os.path.join(os.path.dirname(self.index_path), "shards.json")
+
+    def _save_params(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, "shards.json")
+            with open(fp, "w") as f:
+                json.dump(self.params, f)
+            self.blobstore.upload_file(fp, self._params_path())
@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+class IndexSnapshots:
+    """Versioned index layout: vector_index/v{n}/... plus a CURRENT file naming the live version.
+
+    Version 0 is the unversioned layout (index files directly under vector_index/), so
+    indexes written before snapshots existed are picked up as-is.
+    """
+
+    def __init__(self, blobstore, index_path):
+        self.blobstore = blobstore
+        self.index_path = index_path
+        self.root, self.name = os.path.split(index_path)
+
+    def current(self):
+        pointer = os.path.join(self.root, "CURRENT")
+        if not self.blobstore.exists(pointer):
+            return None
+        return int(self.blobstore.read_file(pointer).strip())
+
+    def path_for(self, version):
+        if version == 0:
+            return self.index_path
+        return os.path.join(self.root, f"v{version}", self.name)
+
+    def publish(self, version):
+        # a single small object write, so readers see either the old or the new version
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fp = os.path.join(tmpdir, "CURRENT")
+            with open(fp, "w") as f:
+                f.write(str(version))
+            self.blobstore.upload_file(fp, os.path.join(self.root, "CURRENT"))